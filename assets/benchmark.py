@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from functools import wraps
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import metrics  # noqa: E402
+import screenshots  # noqa: E402
+from failures import iter_failures  # noqa: E402
+from ocr_backend import get_backend  # noqa: E402
+
+# Corpus layout: a directory of screenshots plus an optional labels.jsonl with one
+# {"file": "war1.png", "kind": "war", "expected": {"points_scored": 1234, ...}} per line.
+# Unlabelled images are still timed, their kind is taken from the "war"/"league" prefix
+# of the filename or from the index.jsonl that failures.py writes next to them.
+
+
+def _timed(stage, func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with metrics.timer(stage):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def instrument(learn=False):
+    # screenshots.py records its own stages, only the raw engine time is added here.
+    # Every sample of the run is kept instead of the bot's rolling window.
+    metrics.METRICS_WINDOW = None
+    backend = get_backend()
+    backend.image_to_string = _timed("tesseract", backend.image_to_string)
+    backend.image_to_data = _timed("tesseract", backend.image_to_data)
+    if not learn:
+        screenshots.get_digit_recognizer().directory = None
+
+
+def load_corpus(directory):
+    labels_fp = os.path.join(directory, "labels.jsonl")
+    entries = {}
+    if os.path.exists(labels_fp):
+        with open(labels_fp, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[entry["file"]] = entry
+    # A fails/ directory is indexed by failures.py, its images are content addressed
+    for failure in iter_failures(directory):
+        for kind in ("war", "league"):
+            fp = failure.get(kind)
+            if fp and fp not in entries and os.path.exists(os.path.join(directory, fp)):
+                entries[fp] = {"file": fp, "kind": kind, "expected": {}}
+    for fp in sorted(os.listdir(directory)):
+        if fp in entries or not fp.lower().endswith((".png", ".jpg", ".jpeg")):
+            continue
+        for kind in ("war", "league"):
+            if fp.startswith(kind):
+                entries[fp] = {"file": fp, "kind": kind, "expected": {}}
+    return list(entries.values())
+
+
+def compare_batched(directory):
+    # The tiled war read must give the same fields as one read per region
+    mismatches = []
+    compared = 0
+    for entry in load_corpus(directory):
+        if entry["kind"] != "war":
+            continue
+        with open(os.path.join(directory, entry["file"]), "rb") as file:
+            img_bytes = file.read()
+        try:
+            single = screenshots.extract_war(img_bytes, batched=False)
+            tiled = screenshots.extract_war(img_bytes, batched=True)
+        except Exception as e:
+            mismatches.append({"file": entry["file"], "error": repr(e)})
+            continue
+        compared += 1
+        for key in single:
+            if str(single[key]) != str(tiled[key]):
+                mismatches.append(
+                    {
+                        "file": entry["file"],
+                        "field": key,
+                        "single": str(single[key]),
+                        "tiled": str(tiled[key]),
+                    }
+                )
+    return {"compared": compared, "mismatches": mismatches}
+
+
+def run(directory, repeat=1):
+    corpus = load_corpus(directory)
+    fields = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    bucket_latency = defaultdict(list)
+    errors = []
+
+    start = time.perf_counter()
+    images = 0
+    for _ in range(repeat):
+        for entry in corpus:
+            with open(os.path.join(directory, entry["file"]), "rb") as file:
+                img_bytes = file.read()
+            small = cv2.imdecode(
+                np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8
+            )
+            bucket = (
+                screenshots.get_category(small.shape[1], small.shape[0])
+                if small is not None
+                else "unreadable"
+            )
+            extract = (
+                screenshots.extract_war
+                if entry["kind"] == "war"
+                else screenshots.extract_league
+            )
+
+            image_start = time.perf_counter()
+            try:
+                result = extract(img_bytes)
+            except Exception as e:
+                errors.append({"file": entry["file"], "error": repr(e)})
+                result = {}
+            elapsed = time.perf_counter() - image_start
+            images += 1
+            bucket_latency[bucket].append(elapsed)
+
+            for key, expected in entry["expected"].items():
+                counts = fields[bucket][f"{entry['kind']}.{key}"]
+                counts[0] += str(result.get(key)) == str(expected)
+                counts[1] += 1
+    wall = time.perf_counter() - start
+
+    return {
+        "images": images,
+        "wall_seconds": round(wall, 3),
+        "throughput": round(images / wall, 2) if wall else None,
+        "backend": get_backend().name,
+        "stages": metrics.summary(),
+        "buckets": {
+            bucket: {
+                "latency": metrics.summarize(bucket_latency[bucket]),
+                "accuracy": {
+                    field: round(ok / total, 4)
+                    for field, (ok, total) in sorted(fields[bucket].items())
+                },
+            }
+            for bucket in sorted(bucket_latency)
+        },
+        "errors": errors,
+    }
+
+
+def print_report(report):
+    print(
+        f"{report['images']} images in {report['wall_seconds']}s "
+        f"({report['throughput']} img/s) with the {report['backend']} backend\n"
+    )
+    print(metrics.format_summary(report["stages"]))
+    for bucket, data in report["buckets"].items():
+        latency = data["latency"]
+        print(
+            f"\n[{bucket}] {latency['n']} images, p50 {latency['p50']} ms, p90 {latency['p90']} ms"
+        )
+        for field, accuracy in data["accuracy"].items():
+            print(f"  {field:<28}{accuracy:>8.1%}")
+    if report["errors"]:
+        print(f"\n{len(report['errors'])} errors:")
+        for error in report["errors"]:
+            print(f"  {error['file']}: {error['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure OCR accuracy and latency over a labelled screenshot corpus"
+    )
+    parser.add_argument("corpus", help="Directory with screenshots and labels.jsonl")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument(
+        "--compare-batched",
+        action="store_true",
+        help="Check that tiled war OCR reads the same fields as per-region OCR",
+    )
+    parser.add_argument(
+        "--learn",
+        action="store_true",
+        help="Persist digit templates learned during the run",
+    )
+    args = parser.parse_args()
+
+    instrument(args.learn)
+    if args.compare_batched:
+        report = compare_batched(args.corpus)
+        print(f"{report['compared']} war screenshots compared")
+        for mismatch in report["mismatches"]:
+            print(f"  {mismatch}")
+    else:
+        report = run(args.corpus, args.repeat)
+        print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,10 @@ import asyncio
 import contextlib
 import csv
 import io
+import json
 import logging
 import os
+import time
 import traceback
 from datetime import date, datetime, timedelta
 from typing import Literal
@@ -23,19 +25,22 @@ from discord import (
     SelectOption,
     app_commands,
 )
-from discord.errors import Forbidden, NotFound
+from discord.errors import Forbidden, HTTPException, NotFound
 from discord.ext import commands
 from discord.ui import Button, Modal, Select, TextInput, View, button
 from discord.utils import setup_logging
 from dotenv import load_dotenv
 
 from database import (
+    PAGE_SIZE,
     add_guild,
     add_member,
     add_submission,
+    add_submissions,
     connect_db,
     delete_guild_from_db,
     edit_label,
+    get_cache_stats,
     get_date,
     get_guild_by_id,
     get_guild_from_member,
@@ -43,16 +48,31 @@ from database import (
     get_inactive_members,
     get_kudos_history,
     get_latest_date,
-    get_leaderboard,
+    get_leaderboard_count,
+    get_leaderboard_page,
     get_missing_submissions,
     get_opponent_guilds_from_name,
-    get_records_data,
+    get_records_page,
+    get_records_stats,
     give_kudo_and_get_guild_info,
-    remove_inactive_members,
     rename_guild,
     reset_guild_server,
+    sync_members,
 )
-from screenshots import extract_league, extract_war
+from failures import ExtractionFailed, save_failure
+from metrics import format_summary, record, summary, timer
+from ocr_pool import (
+    MAX_ATTACHMENT_SIZE,
+    AttachmentTooLarge,
+    check_attachment,
+    extract_league,
+    extract_war,
+    read_attachment,
+    remote_timings,
+    start_ocr,
+    stop_ocr,
+)
+from submission_queue import QueueFull, SubmissionQueue, UserLimitReached
 
 setup_logging()
 logger = logging.getLogger()
@@ -98,6 +118,17 @@ LABELS = {
 
 RESULT_MAP = {"Win": "🟩", "Loss": "🟥", "Draw": "⬜"}
 
+QUEUE_MESSAGES = {
+    QueueFull: "🚦 The bot is busy reading a lot of screenshots right now, please try again in a few minutes.",
+    UserLimitReached: "⏳ You already have screenshots being processed, please wait for them to finish.",
+}
+
+TOO_LARGE_MESSAGE = (
+    f"❌ Screenshots must be smaller than {MAX_ATTACHMENT_SIZE // 1024 // 1024} MB"
+)
+
+submission_queue = SubmissionQueue()
+
 
 def is_staff(i: Interaction):
     return (
@@ -125,30 +156,71 @@ class ConfirmView(View):
         await interaction.response.edit_message(content="Cancelled ❌", view=None)
 
 
-class LeaderboardPaginator:
-    def __init__(self, **kwargs) -> None:
-        self.rows: list[str] = kwargs.get("leaderboard")
-        self.i: Interaction = kwargs.get("interaction")
-        self.display_filters: str = kwargs.get("display_filters")
-        self.ITEMS_PER_PAGE = 20
+class KeysetPaginator:
+    # Only the page on screen is held, its neighbours are read from the cursors of
+    # the first and last row and the last page by reading the history backwards
+    ITEMS_PER_PAGE = PAGE_SIZE
+
+    def __init__(self, interaction, total, **kwargs) -> None:
+        self.i: Interaction = interaction
+        self.total: int = total
+        self.rows: list[tuple] = []
+        self.first = self.last = None
+        self.loaded = None
         self.view = (
             PaginatorView(self.i, self, timeout=30)
-            if len(self.rows) > self.ITEMS_PER_PAGE
+            if self.total > self.ITEMS_PER_PAGE
             else None
         )
 
         self.page = kwargs.get("page", 1)
-        calculation = len(self.rows) / self.ITEMS_PER_PAGE
-        self.total_pages = (
-            int(calculation) if calculation.is_integer() else int(calculation) + 1
-        )
-        if self.total_pages == 0:
-            self.total_pages = 1
+        self.total_pages = max(1, -(-self.total // self.ITEMS_PER_PAGE))
+
+    async def fetch(self, **kwargs) -> tuple:
+        raise NotImplementedError
+
+    async def load(self):
+        if self.page == self.loaded:
+            return
+        if not self.total:
+            page = ([], None, None)
+        elif self.page == 1:
+            page = await self.fetch()
+        elif self.page == self.total_pages:
+            remaining = self.total - (self.total_pages - 1) * self.ITEMS_PER_PAGE
+            page = await self.fetch(last=True, limit=remaining)
+        elif self.page > self.loaded:
+            page = await self.fetch(after=self.last)
+        else:
+            page = await self.fetch(before=self.first)
+        self.rows, self.first, self.last = page
+        self.loaded = self.page
 
-    def _get_rows(self) -> list[dict]:
-        return self.rows[
-            (self.page - 1) * self.ITEMS_PER_PAGE : self.page * self.ITEMS_PER_PAGE
-        ]
+    @property
+    def embed(self) -> Embed:
+        return self._build_embed()
+
+    async def send_message(self, i: Interaction):
+        await self.load()
+        if not i.command:
+            self.view.update_buttons()
+            await i.followup.edit_message(
+                message_id=i.message.id, embed=self.embed, view=self.view
+            )
+        elif self.view:
+            await i.followup.send(embed=self.embed, view=self.view)
+        else:
+            await i.followup.send(embed=self.embed)
+
+
+class LeaderboardPaginator(KeysetPaginator):
+    def __init__(self, date, **kwargs) -> None:
+        super().__init__(kwargs.pop("interaction"), kwargs.pop("total"), **kwargs)
+        self.date = date
+        self.display_filters: str = kwargs.get("display_filters")
+
+    async def fetch(self, **kwargs) -> tuple:
+        return await get_leaderboard_page(self.date, **kwargs)
 
     def _build_embed(self):
         embed = Embed(
@@ -162,7 +234,7 @@ class LeaderboardPaginator:
             league,
             division,
             num,
-        ) in self._get_rows():
+        ) in self.rows:
             embed.add_field(
                 name=f"#{num} {guild_name} (S{server_number})",
                 value=f"`{total_points}` {league} League {division}",
@@ -175,63 +247,47 @@ class LeaderboardPaginator:
         )
         return embed
 
-    @property
-    def embed(self) -> Embed:
-        return self._build_embed()
-
-    async def send_message(self, i: Interaction):
-        if not i.command:
-            self.view.update_buttons()
-            await i.followup.edit_message(
-                message_id=i.message.id, embed=self.embed, view=self.view
-            )
-        elif self.view:
-            await i.followup.send(embed=self.embed, view=self.view)
-        else:
-            await i.followup.send(embed=self.embed)
-
 
-class RecordsPaginator:
+class RecordsPaginator(KeysetPaginator):
     def __init__(
         self,
-        data,
+        guild_data,
+        season,
+        stats,
         guild_name,
         display_date,
-        summary,
         interaction,
         opponent=False,
         **kwargs,
     ) -> None:
-        self.data: list[tuple] = data
+        super().__init__(interaction, stats["submissions"] if stats else 0, **kwargs)
+        self.guild_data = guild_data
+        self.season: str | None = season
+        self.stats: dict | None = stats
         self.guild_name: str = guild_name
         self.display_date: str = display_date
-        self.summary: str = summary
-        self.i: Interaction = interaction
+        self.summary: str | None = None
         self.opponent: bool = opponent
-        self.ITEMS_PER_PAGE = 20
-        self.view = (
-            PaginatorView(self.i, self, timeout=30)
-            if len(self.data) > self.ITEMS_PER_PAGE
-            else None
-        )
 
-        self.page = kwargs.get("page", 1)
-        calculation = len(self.data) / self.ITEMS_PER_PAGE
-        self.total_pages = (
-            int(calculation) if calculation.is_integer() else int(calculation) + 1
+    async def fetch(self, **kwargs) -> tuple:
+        return await get_records_page(
+            self.guild_data, self.season, self.opponent, **kwargs
         )
-        if self.total_pages == 0:
-            self.total_pages = 1
 
-    def _get_rows(self) -> list[dict]:
-        return self.data[
-            (self.page - 1) * self.ITEMS_PER_PAGE : self.page * self.ITEMS_PER_PAGE
-        ]
+    async def load(self):
+        await super().load()
+        # The first page loaded is the newest one, it also gives the last results
+        if self.summary is None:
+            self.summary = (
+                get_records_summary(self.stats, self.rows, self.opponent)
+                if self.rows and self.stats
+                else ""
+            )
 
     def _build_embed(self):
         embed = Embed(
             title=self.guild_name,
-            description=self.summary if self.data else "No results found",
+            description=self.summary if self.rows else "No results found",
             color=Color.blue(),
         )
 
@@ -242,7 +298,7 @@ class RecordsPaginator:
             other_scored,
             submission_date,
             result,
-        ) in self._get_rows():
+        ) in self.rows:
             if self.opponent:
                 if result == "Win":
                     result = "Loss"
@@ -258,21 +314,6 @@ class RecordsPaginator:
         embed.set_author(name=f"Opponent Data - {self.display_date}")
         return embed
 
-    @property
-    def embed(self) -> Embed:
-        return self._build_embed()
-
-    async def send_message(self, i: Interaction):
-        if not i.command:
-            self.view.update_buttons()
-            await i.followup.edit_message(
-                message_id=i.message.id, embed=self.embed, view=self.view
-            )
-        elif self.view:
-            await i.followup.send(embed=self.embed, view=self.view)
-        else:
-            await i.followup.send(embed=self.embed)
-
 
 class MissingSubmissionPaginator:
     def __init__(self, data, period, interaction, **kwargs) -> None:
@@ -467,23 +508,54 @@ class PaginatorView(View):
         return await self.callback(interaction, button)
 
 
+def find_field(embed: Embed, label: str) -> tuple[int, str] | None:
+    return next(
+        (
+            (n, field.value)
+            for n, field in enumerate(embed.fields)
+            if field.name == label
+        ),
+        None,
+    )
+
+
 class AmendModal(Modal):
-    def __init__(self, id_, label, value, message, field_index):
+    def __init__(self, id_, label, value, message, field_index, submissions=1):
         self.id_ = id_
         self.label = label
         self.value = value
         self.message: Message = message
         self.field_index: int = field_index
+        self.embed_index = 0
         if label == "date":
             label = "date [YYY-mm-dd]"
         self.amend = TextInput(
             label=label, default=str(value) if value is not None else None
         )
         super().__init__(title="Enter the corrected data")
+        self.submission = None
+        if submissions > 1:
+            self.submission = TextInput(
+                label=f"Submission number (1-{submissions})", max_length=2
+            )
+            self.add_item(self.submission)
         self.add_item(self.amend)
 
     async def on_submit(self, i: Interaction):
         await i.response.defer()
+        if self.submission is not None:
+            embeds = self.message.embeds
+            if not self.submission.value.isdigit() or not (
+                1 <= int(self.submission.value) <= len(embeds)
+            ):
+                return await i.followup.send(
+                    f"Submission number must be between 1 and {len(embeds)}"
+                )
+            self.embed_index = int(self.submission.value) - 1
+            embed = embeds[self.embed_index]
+            self.id_ = embed.footer.text.removeprefix("Submission ID: ")
+            self.field_index, self.value = find_field(embed, self.label) or (None, None)
+
         if self.amend.value == str(self.value):
             return await i.followup.send("The data wasn't modified...")
 
@@ -512,9 +584,11 @@ class AmendModal(Modal):
             logger.error("FAILED EDIT LABEL", e)
             return await i.followup.send("Failed amending data...")
         await i.followup.send(f"{self.label} was updated to {value}")
-        n_embed = self.message.embeds[0]
-        n_embed.set_field_at(self.field_index, name=self.label, value=value)
-        await self.message.edit(embed=n_embed)
+        embeds = self.message.embeds
+        embeds[self.embed_index].set_field_at(
+            self.field_index, name=self.label, value=value
+        )
+        await self.message.edit(embeds=embeds)
 
 
 class AmendSelect(Select):
@@ -530,18 +604,17 @@ class AmendSelect(Select):
 
     async def callback(self, i: Interaction):
         label = self.values[0]
-        field_data = next(
-            (
-                (n, field.value)
-                for n, field in enumerate(i.message.embeds[0].fields)
-                if field.name == label
-            ),
-            None,
-        )
+        embeds = i.message.embeds
+        if len(embeds) > 1:
+            # Batch summaries hold one embed per submission, the modal asks which one
+            return await i.response.send_modal(
+                AmendModal(None, label, None, i.message, None, len(embeds))
+            )
+        field_data = find_field(embeds[0], label)
         value = field_index = None
         if field_data is not None:
             field_index, value = field_data
-        id_ = i.message.embeds[0].footer.text.removeprefix("Submission ID: ")
+        id_ = embeds[0].footer.text.removeprefix("Submission ID: ")
         await i.response.send_modal(
             AmendModal(id_, label, value, i.message, field_index)
         )
@@ -572,6 +645,22 @@ async def sync(ctx):
     await ctx.send("Commands synced!")
 
 
+@bot.command()
+@commands.is_owner()
+async def timings(ctx):
+    # Stages recorded in this process win over the service's summary of the same name
+    stats = dict(sorted({**await remote_timings(), **summary()}.items()))
+    caches = get_cache_stats()
+    if not stats and not caches:
+        return await ctx.send("No timings recorded yet")
+    report = {"stages": stats, "caches": caches}
+    cache_line = ", ".join(f"{key}: {count}" for key, count in sorted(caches.items()))
+    await ctx.send(
+        f"```\n{format_summary(stats)}\n\n{cache_line or 'No cache lookups yet'}\n```",
+        file=File(io.BytesIO(json.dumps(report, indent=2).encode()), "timings.json"),
+    )
+
+
 @bot.tree.command(description="Register your guild and server")
 async def register_guild(i: Interaction, guild_name: str, server_number: int):
     if not is_staff(i):
@@ -649,9 +738,101 @@ async def purge_inactive_members(i: Interaction):
             "❌ Could not find the main guild.",
             ephemeral=True,
         )
-    active_user_ids = [member.id async for member in guild.fetch_members(limit=None)]
-    await remove_inactive_members(active_user_ids)
-    await i.followup.send("✅ Inactive members removed successfully.")
+    active_user_ids = {member.id async for member in guild.fetch_members(limit=None)}
+    removed = await sync_members(active_user_ids)
+    await i.followup.send(f"✅ Removed {removed} inactive members.")
+
+
+async def save_failed_screenshots(
+    user_id, war: Attachment, league: Attachment, error, partial=None
+):
+    # The raw bytes aren't kept around after OCR, failures are rare enough to fetch again
+    screenshots = []
+    for attachment in (war, league):
+        try:
+            screenshots.append(await read_attachment(attachment))
+        except Exception:
+            screenshots.append(None)
+    await save_failure(*screenshots, user_id, error, partial)
+
+
+async def ingest(attachment: Attachment, extract):
+    # No reference to the raw bytes outlives the extraction of this attachment
+    with timer("download"):
+        img_bytes = await read_attachment(attachment)
+    return await extract(img_bytes)
+
+
+async def read_screenshots(war: Attachment, league: Attachment):
+    check_attachment(war)
+    check_attachment(league)
+    war_data, league_data = await asyncio.gather(
+        ingest(war, extract_war),
+        ingest(league, extract_league),
+        return_exceptions=True,
+    )
+    for result in (war_data, league_data):
+        if isinstance(result, Exception):
+            partial = {
+                "war": None if isinstance(war_data, Exception) else war_data,
+                "league": None if isinstance(league_data, Exception) else league_data,
+            }
+            raise ExtractionFailed(result, partial)
+    return war_data, league_data
+
+
+async def queued(i: Interaction, func):
+    shown = False
+
+    async def show_position(position):
+        nonlocal shown
+        shown = True
+        await i.edit_original_response(
+            content=f"⏳ Your screenshots are queued, position **{position}**"
+        )
+
+    async def start():
+        record("queue_wait", time.perf_counter() - enqueued)
+        if shown:
+            await i.edit_original_response(content="⚙️ Reading your screenshots...")
+        return await func()
+
+    enqueued = time.perf_counter()
+    try:
+        return await submission_queue.run(i.user.id, start, show_position)
+    finally:
+        # The result goes out as a followup, the queue message would stay behind
+        if shown:
+            with contextlib.suppress(HTTPException):
+                await i.delete_original_response()
+
+
+def build_submission_embed(user, guild_name, server_number, id_, war_data, league_data):
+    embed = Embed(
+        color=Color.green(),
+        title="Screenshots recorded ✅",
+    )
+    embed.add_field(name="Submitted by", value=user.mention)
+    embed.set_footer(text=f"Submission ID: {id_}")
+    embed.set_author(name=f"{guild_name} (S{server_number})")
+    for data in (
+        war_data,
+        league_data,
+    ):
+        for key, value in data.items():
+            embed.add_field(name=key, value=value if value is not None else "???")
+    uncertain = [
+        key
+        for data in (war_data, league_data)
+        for key in getattr(data, "uncertain", ())
+    ]
+    if uncertain:
+        embed.add_field(
+            name="Please double check",
+            value=", ".join(uncertain),
+            inline=False,
+        )
+    return embed
 
 
 @bot.tree.command(description="Submit screenshots to register results")
@@ -667,48 +848,192 @@ async def submit(i: Interaction, war: Attachment, league: Attachment):
         )
     _, guild_name, server_number = await get_guild_by_id(guild_id)
 
+    war_data = league_data = None
     try:
-        war_data = extract_war(await war.read())
-        league_data = extract_league(await league.read())
-        id_ = await add_submission(
-            **war_data,
-            **league_data,
-            submitted_by=i.user.id,
-        )
+        with timer("submit"):
+            war_data, league_data = await queued(
+                i, lambda: read_screenshots(war, league)
+            )
+            with timer("db.add_submission"):
+                id_ = await add_submission(
+                    **war_data,
+                    **league_data,
+                    submitted_by=i.user.id,
+                )
+    except (QueueFull, UserLimitReached) as e:
+        return await i.followup.send(QUEUE_MESSAGES[type(e)])
+    except AttachmentTooLarge:
+        return await i.followup.send(TOO_LARGE_MESSAGE)
     except Exception as e:
         logger.error("FAILED EXTRACT OR ADD SUBMISSION", e)
-        n = len(os.listdir("fails"))
-        await war.save(f"fails/war_error{n}.png")
-        await league.save(f"fails/league_error{n}.png")
+        partial = (
+            e.partial
+            if isinstance(e, ExtractionFailed)
+            else {"war": war_data, "league": league_data}
+        )
+        await save_failed_screenshots(i.user.id, war, league, e, partial)
         return await i.followup.send(
             "Failed to read screenshots... Make sure you added them in the right order ❌"
         )
 
-    embed = Embed(
-        color=Color.green(),
-        title="Screenshots recorded ✅",
+    embed = build_submission_embed(
+        i.user, guild_name, server_number, id_, war_data, league_data
     )
-    embed.add_field(name="Submitted by", value=i.user.mention)
-    embed.set_footer(text=f"Submission ID: {id_}")
-    embed.set_author(name=f"{guild_name} (S{server_number})")
-    labels = {}
-    for data in (
-        war_data,
-        league_data,
-    ):
-        for key, value in data.items():
-            labels[key] = value
-            embed.add_field(name=key, value=value if value is not None else "???")
-
     view = AmendView()
     view.message = await i.followup.send(embed=embed, view=view)
 
 
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 2))
+
+
+@bot.tree.command(description="Submit several pairs of screenshots at once")
+@app_commands.describe(
+    war1="Screenshot of Guild War Log",
+    league1="Screenshot of Championsip League",
+    guild1="Guild of the first pair (staff only, defaults to your guild)",
+    guild2="Guild of the second pair (staff only, defaults to your guild)",
+    guild3="Guild of the third pair (staff only, defaults to your guild)",
+    guild4="Guild of the fourth pair (staff only, defaults to your guild)",
+    guild5="Guild of the fifth pair (staff only, defaults to your guild)",
+)
+@app_commands.autocomplete(
+    guild1=guild_name_autocomplete,
+    guild2=guild_name_autocomplete,
+    guild3=guild_name_autocomplete,
+    guild4=guild_name_autocomplete,
+    guild5=guild_name_autocomplete,
+)
+async def submit_batch(
+    i: Interaction,
+    war1: Attachment,
+    league1: Attachment,
+    war2: Attachment = None,
+    league2: Attachment = None,
+    war3: Attachment = None,
+    league3: Attachment = None,
+    war4: Attachment = None,
+    league4: Attachment = None,
+    war5: Attachment = None,
+    league5: Attachment = None,
+    guild1: str = None,
+    guild2: str = None,
+    guild3: str = None,
+    guild4: str = None,
+    guild5: str = None,
+):
+    await i.response.defer()
+    pairs = [
+        (war, league, guild)
+        for war, league, guild in (
+            (war1, league1, guild1),
+            (war2, league2, guild2),
+            (war3, league3, guild3),
+            (war4, league4, guild4),
+            (war5, league5, guild5),
+        )
+        if war is not None or league is not None
+    ]
+    if any(war is None or league is None for war, league, _ in pairs):
+        return await i.followup.send(
+            "Each war screenshot needs its league screenshot ❌"
+        )
+    if any(guild is not None for _, _, guild in pairs) and not is_staff(i):
+        return await i.followup.send(
+            "❌ You must have 'Manage Server' permission to submit for another guild."
+        )
+
+    own_guild = await get_guild_from_member(i.user.id)
+    guilds = {}
+    for _, _, guild in pairs:
+        guild_id = guild or (own_guild[0] if own_guild else None)
+        if guild_id is None:
+            return await i.followup.send(
+                "You're not registered in any guild, use the `/register_guild` command first"
+            )
+        if guild_id not in guilds:
+            row = await get_guild_by_id(guild_id)
+            if not row:
+                return await i.followup.send("❌ Guild not found", ephemeral=True)
+            guilds[guild_id] = row
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def process(war: Attachment, league: Attachment):
+        async with semaphore:
+            return await read_screenshots(war, league)
+
+    # The whole batch takes one queue slot, BATCH_CONCURRENCY bounds it internally
+    try:
+        results = await queued(
+            i,
+            lambda: asyncio.gather(
+                *(process(war, league) for war, league, _ in pairs),
+                return_exceptions=True,
+            ),
+        )
+    except (QueueFull, UserLimitReached) as e:
+        return await i.followup.send(QUEUE_MESSAGES[type(e)])
+
+    submissions = []
+    failed = []
+    for n, ((war, league, guild), result) in enumerate(zip(pairs, results), start=1):
+        if isinstance(result, AttachmentTooLarge):
+            failed.append(n)
+            continue
+        if isinstance(result, Exception):
+            logger.error(f"FAILED EXTRACT BATCH PAIR {n}", result)
+            partial = result.partial if isinstance(result, ExtractionFailed) else None
+            await save_failed_screenshots(i.user.id, war, league, result, partial)
+            failed.append(n)
+            continue
+        war_data, league_data = result
+        if war_data.get("date") is None:
+            # date is NOT NULL, one undated row would fail the whole multi-row insert
+            error = ValueError("Could not read the date")
+            await save_failed_screenshots(
+                i.user.id, war, league, error, {**war_data, **league_data}
+            )
+            failed.append(n)
+            continue
+        guild_id = guild or own_guild[0]
+        submissions.append((guild_id, war_data, league_data))
+
+    try:
+        with timer("db.add_submissions"):
+            ids = await add_submissions(
+                [
+                    {"guild_id": guild_id, **war_data, **league_data}
+                    for guild_id, war_data, league_data in submissions
+                ],
+                i.user.id,
+            )
+    except Exception as e:
+        logger.error("FAILED ADD BATCH SUBMISSIONS", e)
+        return await i.followup.send("Failed to record the submissions... ❌")
+
+    embeds = []
+    for id_, (guild_id, war_data, league_data) in zip(ids, submissions):
+        _, guild_name, server_number = guilds[guild_id]
+        embeds.append(
+            build_submission_embed(
+                i.user, guild_name, server_number, id_, war_data, league_data
+            )
+        )
+    content = (
+        f"Failed to read screenshots for pair(s) {', '.join(map(str, failed))} ❌"
+        if failed
+        else None
+    )
+    if not embeds:
+        return await i.followup.send(content)
+    view = AmendView()
+    view.message = await i.followup.send(content=content, embeds=embeds, view=view)
+
+
 async def date_autocomplete(
     _: Interaction, current: str
 ) -> list[app_commands.Choice[str]]:
-    results = await get_date(current)
-    return [app_commands.Choice(name=str(row[0]), value=str(row[0])) for row in results]
+    return [app_commands.Choice(name=day, value=day) for day in await get_date(current)]
 
 
 async def season_autocomplete(
@@ -736,7 +1061,8 @@ async def leaderboard(i: Interaction, date: str = None):
         date = str(date)
 
     paginator = LeaderboardPaginator(
-        leaderboard=await get_leaderboard(date),
+        date=date,
+        total=await get_leaderboard_count(date),
         interaction=i,
         display_filters=date,
     )
@@ -762,32 +1088,26 @@ def get_formatted_results(results: dict) -> str:
     return " - ".join(result_types)
 
 
-def get_records_summary(data, opponent=False):
-    points = 0
-    seasons = []
-
-    results = {"Win": 0, "Loss": 0, "Draw": 0}
+def get_records_summary(stats, data, opponent=False):
+    # Totals come from the per-season aggregates, only the latest rows are read here
     last_5 = []
-    for n, row in enumerate(data):
-        _, _, scored, _, date, result = row
-        points += scored
-        season = f"`{str(date)[:-3]}`"
-        if season not in seasons:
-            seasons.append(season)
+    for row in data[:6]:
+        result = row[5]
         if opponent:
             if result == "Win":
                 result = "Loss"
             elif result == "Loss":
                 result = "Win"
-        results[result] += 1
-        if n <= 5:
-            last_5.append(RESULT_MAP[result])
+        last_5.append(RESULT_MAP[result])
 
-    average = f"**Average**: `{points // len(data)}`"
+    average = f"**Average**: `{stats['points'] // stats['submissions']}`"
+    seasons = [f"`{season}`" for season in stats["seasons"]]
     f_seasons = f"**Seasons covered**: {', '.join(seasons)}"
     f_last_5 = f"**Last 5**: {' '.join(last_5)}"
 
-    return "\n".join([get_formatted_results(results), f_last_5, average, f_seasons])
+    return "\n".join(
+        [get_formatted_results(stats["results"]), f_last_5, average, f_seasons]
+    )
 
 
 async def opponent_guild_autocomplete(
@@ -821,14 +1141,14 @@ async def check_opponent(i: Interaction, guild: str, season: str = None):
         return await i.followup.send(f"Couldn't find results for guild {guild}")
 
     display_date = get_display_date(season)
-    data = await get_records_data([guild_name, server_number], season, True)
-    summary = get_records_summary(data, True) if data else ""
+    stats = await get_records_stats([guild_name, server_number], season, True)
 
     paginator = RecordsPaginator(
-        data=data,
+        guild_data=[guild_name, server_number],
+        season=season,
+        stats=stats,
         guild_name=f"{guild_name} (S{server_number})",
         display_date=display_date,
-        summary=summary,
         interaction=i,
         opponent=True,
     )
@@ -848,14 +1168,14 @@ async def my_guild(i: Interaction, season: str = None):
     _, guild_name, server_number = await get_guild_by_id(guild_id)
 
     display_date = get_display_date(season)
-    data = await get_records_data(guild_id, season)
-    summary = get_records_summary(data) if data else ""
+    stats = await get_records_stats(guild_id, season)
 
     paginator = RecordsPaginator(
-        data=data,
+        guild_data=guild_id,
+        season=season,
+        stats=stats,
         guild_name=f"{guild_name} (S{server_number})",
         display_date=display_date,
-        summary=summary,
         interaction=i,
     )
     await paginator.send_message(i)
@@ -930,14 +1250,14 @@ async def check_guild(i: Interaction, guild: str, season: str = None):
     _, guild_name, server_number = await get_guild_by_id(guild)
 
     display_date = get_display_date(season)
-    data = await get_records_data(guild, season)
-    summary = get_records_summary(data) if data else ""
+    stats = await get_records_stats(guild, season)
 
     paginator = RecordsPaginator(
-        data=data,
+        guild_data=guild,
+        season=season,
+        stats=stats,
         guild_name=f"{guild_name} (S{server_number})",
         display_date=display_date,
-        summary=summary,
         interaction=i,
     )
     await paginator.send_message(i)
@@ -1121,7 +1441,13 @@ async def on_command_error(ctx, error):
 
 async def main():
     await connect_db()
-    await bot.start(TOKEN)
+    start_ocr()
+    try:
+        await bot.start(TOKEN)
+    finally:
+        stop_ocr()
 
 
-asyncio.run(main())
+# OCR workers may be started with spawn or forkserver, which re-import this module
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,19 +1,154 @@
+import logging
 import os
+from collections import Counter, OrderedDict
+from datetime import date as date_type
 from datetime import datetime
 
 import aiomysql
 from dotenv import load_dotenv
 from pymysql.err import IntegrityError
 
+from search import DateIndex, NgramIndex
+
 load_dotenv()
 
 pool: aiomysql.Pool = None
 
+LEADERBOARD_CACHE_SIZE = int(os.getenv("LEADERBOARD_CACHE_SIZE", 64))
+PAGE_SIZE = 20
+LEADERBOARD_LABELS = {"date", "total_points", "league", "division"}
+OPPONENT_LABELS = {"opponent_guild", "opponent_server"}
+SEASON_LABELS = OPPONENT_LABELS | {"date", "points_scored", "opponent_scored"}
+
+# Leaderboard pages and row count per date, with the ids of the guilds they contain
+# so a guild change only drops the dates that guild appears in
+leaderboard_cache: OrderedDict[str, tuple[dict, set[int]]] = OrderedDict()
+_UNSET = object()
+latest_date_cache = _UNSET
+# Bumped by every invalidation, a query that raced with a write isn't cached
+cache_generation = 0
+cache_stats: Counter[str] = Counter()
+
+# guild id -> (id, guild_name, server_number), serves autocomplete without MySQL
+guild_index = NgramIndex()
+# (opponent_guild, opponent_server) of the opponents table, same purpose
+opponent_index = NgramIndex()
+# Distinct submission dates for date autocomplete
+date_index = DateIndex()
+
 
 def now():
     return datetime.now()
 
 
+def _date_key(value) -> str:
+    try:
+        year, month, day = (int(part) for part in str(value)[:10].split("-"))
+        return date_type(year, month, day).isoformat()
+    except ValueError:
+        return str(value)
+
+
+def season_range(season: str) -> tuple[date_type, date_type]:
+    year, month = (int(part) for part in season.split("-"))
+    return date_type(year, month, 1), date_type(year + month // 12, month % 12 + 1, 1)
+
+
+def invalidate_leaderboard(*dates, latest=True):
+    global latest_date_cache, cache_generation
+    cache_generation += 1
+    for value in dates:
+        leaderboard_cache.pop(_date_key(value), None)
+    if latest:
+        latest_date_cache = _UNSET
+
+
+def _added_dates(*dates):
+    # An insert can only move the latest date forward
+    cached = latest_date_cache
+    newer = cached is _UNSET or any(
+        value is not None and (cached is None or _date_key(value) > _date_key(cached))
+        for value in dates
+    )
+    invalidate_leaderboard(*dates, latest=newer)
+
+
+def invalidate_guild(guild_id):
+    global cache_generation
+    cache_generation += 1
+    for key, (_, guild_ids) in list(leaderboard_cache.items()):
+        if int(guild_id) in guild_ids:
+            del leaderboard_cache[key]
+
+
+def _cached(key, page_key):
+    cached = leaderboard_cache.get(key)
+    if cached is None or page_key not in cached[0]:
+        cache_stats["leaderboard_miss"] += 1
+        return None
+    cache_stats["leaderboard_hit"] += 1
+    leaderboard_cache.move_to_end(key)
+    return cached[0][page_key]
+
+
+def _cache(key, page_key, value, guild_ids, generation):
+    if generation != cache_generation:
+        return
+    pages, ids = leaderboard_cache.setdefault(key, ({}, set()))
+    pages[page_key] = value
+    ids.update(guild_ids)
+    leaderboard_cache.move_to_end(key)
+    while len(leaderboard_cache) > LEADERBOARD_CACHE_SIZE:
+        leaderboard_cache.popitem(last=False)
+
+
+def _before(columns, cursor) -> tuple[str, list]:
+    # Rows ahead of cursor when ordered by columns descending, NULL sorts lowest as
+    # MySQL does
+    first, second = columns
+    if cursor[0] is None:
+        return f"({first} IS NOT NULL OR {second} > %s)", [cursor[1]]
+    return f"({first} > %s OR ({first} = %s AND {second} > %s))", [
+        cursor[0],
+        cursor[0],
+        cursor[1],
+    ]
+
+
+def _after(columns, cursor) -> tuple[str, list]:
+    first, second = columns
+    if cursor[0] is None:
+        return f"{first} IS NULL AND {second} < %s", [cursor[1]]
+    return f"({first} < %s OR ({first} = %s AND {second} < %s) OR {first} IS NULL)", [
+        cursor[0],
+        cursor[0],
+        cursor[1],
+    ]
+
+
+def _keyset(query, params, columns, after=None, before=None, last=False, limit=None):
+    # Pages are ordered by columns descending, a cursor starts with the value of
+    # columns on the first or last row of the page next to the one asked for. before
+    # and last read backwards through the index and the rows are flipped back.
+    first, second = columns
+    if after is not None:
+        condition, values = _after(columns, after)
+        query += f" AND {condition}"
+        params += values
+    elif before is not None:
+        condition, values = _before(columns, before)
+        query += f" AND {condition}"
+        params += values
+    order = "ASC" if before is not None or last else "DESC"
+    query += f" ORDER BY {first} {order}, {second} {order} LIMIT %s"
+    params.append(limit or PAGE_SIZE)
+    return query, params, order == "ASC"
+
+
+def get_cache_stats() -> dict[str, int]:
+    return dict(cache_stats)
+
+
 async def connect_db():
     global pool
     pool = await aiomysql.create_pool(
@@ -23,6 +158,346 @@ async def connect_db():
         db=os.getenv("DB_NAME"),
         autocommit=True,
     )
+    await init_db()
+    await load_guild_index()
+    await load_opponent_index()
+    await load_date_index()
+
+
+async def _create_tables(cursor):
+    await cursor.execute("""CREATE TABLE IF NOT EXISTS guilds (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            guild_name VARCHAR(255) NOT NULL,
+            server_number INT NOT NULL,
+            user_id BIGINT,
+            username VARCHAR(255),
+            registered_at DATETIME,
+            UNIQUE KEY uq_guilds_name_server (guild_name, server_number)
+        )""")
+    await cursor.execute("""CREATE TABLE IF NOT EXISTS members (
+            user_id BIGINT PRIMARY KEY,
+            username VARCHAR(255),
+            guild_id INT NOT NULL,
+            FOREIGN KEY (guild_id) REFERENCES guilds (id) ON DELETE CASCADE
+        )""")
+    await cursor.execute("""CREATE TABLE IF NOT EXISTS submissions (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            guild_id INT NOT NULL,
+            points_scored INT,
+            opponent_server INT,
+            opponent_guild VARCHAR(255),
+            opponent_scored INT,
+            date DATE NOT NULL,
+            total_points INT,
+            league VARCHAR(32),
+            division INT,
+            submitted_by BIGINT,
+            result VARCHAR(4) GENERATED ALWAYS AS (
+                CASE
+                    WHEN points_scored > opponent_scored THEN 'Win'
+                    WHEN points_scored < opponent_scored THEN 'Loss'
+                    ELSE 'Draw'
+                END
+            ) STORED,
+            UNIQUE KEY uq_submissions_guild_date (guild_id, date),
+            FOREIGN KEY (guild_id) REFERENCES guilds (id) ON DELETE CASCADE
+        )""")
+    await cursor.execute("""CREATE TABLE IF NOT EXISTS kudos (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            guild_id INT NOT NULL,
+            sender VARCHAR(255),
+            message TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (guild_id) REFERENCES guilds (id) ON DELETE CASCADE
+        )""")
+
+
+async def _create_opponents(cursor):
+    await cursor.execute("""CREATE TABLE IF NOT EXISTS opponents (
+            opponent_guild VARCHAR(255) NOT NULL,
+            opponent_server INT NOT NULL,
+            PRIMARY KEY (opponent_guild, opponent_server)
+        )""")
+    # One time backfill, afterwards the table follows every write
+    await cursor.execute(
+        """INSERT IGNORE INTO opponents (opponent_guild, opponent_server)
+        SELECT DISTINCT opponent_guild, opponent_server FROM submissions
+        WHERE opponent_guild IS NOT NULL AND opponent_server IS NOT NULL"""
+    )
+
+
+async def _create_index(cursor, table, name, columns: tuple[str, ...]):
+    # Databases created before the migrations may already have an equivalent index
+    # under another name, any index starting with the same columns is enough
+    await cursor.execute(
+        """SELECT GROUP_CONCAT(column_name ORDER BY seq_in_index)
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s
+        GROUP BY index_name""",
+        (table,),
+    )
+    wanted = ",".join(columns)
+    for (existing,) in await cursor.fetchall():
+        if f"{existing.lower()},".startswith(f"{wanted},"):
+            return
+    await cursor.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+
+
+async def _create_indexes(cursor):
+    # get_leaderboard_page: one date ranked by points, covering the selected columns
+    await _create_index(
+        cursor,
+        "submissions",
+        "idx_submissions_leaderboard",
+        ("date", "total_points", "guild_id", "league", "division"),
+    )
+    # get_records_page, get_missing_submissions and get_inactive_members
+    await _create_index(
+        cursor, "submissions", "idx_submissions_guild_date", ("guild_id", "date")
+    )
+    # get_records_page(opponent=True) and pruning the opponents table
+    await _create_index(
+        cursor,
+        "submissions",
+        "idx_submissions_opponent",
+        ("opponent_guild", "opponent_server", "date"),
+    )
+    # add_submission looks up the row it overwrote
+    await _create_index(
+        cursor, "submissions", "idx_submissions_submitter", ("submitted_by", "date")
+    )
+    await _create_index(cursor, "members", "idx_members_guild", ("guild_id",))
+    await _create_index(cursor, "kudos", "idx_kudos_guild", ("guild_id", "created_at"))
+
+
+async def _create_season_stats(cursor):
+    # Wins, losses and points are stored from the point of view of the guild, or of
+    # the opponent in opponent_seasons
+    await cursor.execute("""CREATE TABLE IF NOT EXISTS guild_seasons (
+            guild_id INT NOT NULL,
+            season CHAR(7) NOT NULL,
+            wins INT NOT NULL DEFAULT 0,
+            losses INT NOT NULL DEFAULT 0,
+            draws INT NOT NULL DEFAULT 0,
+            points BIGINT NOT NULL DEFAULT 0,
+            submissions INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, season)
+        )""")
+    await cursor.execute("""CREATE TABLE IF NOT EXISTS opponent_seasons (
+            opponent_guild VARCHAR(255) NOT NULL,
+            opponent_server INT NOT NULL,
+            season CHAR(7) NOT NULL,
+            wins INT NOT NULL DEFAULT 0,
+            losses INT NOT NULL DEFAULT 0,
+            draws INT NOT NULL DEFAULT 0,
+            points BIGINT NOT NULL DEFAULT 0,
+            submissions INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (opponent_guild, opponent_server, season)
+        )""")
+    await cursor.execute("""INSERT IGNORE INTO guild_seasons
+        SELECT guild_id, DATE_FORMAT(date, '%Y-%m'),
+            SUM(result = 'Win'), SUM(result = 'Loss'), SUM(result = 'Draw'),
+            COALESCE(SUM(points_scored), 0), COUNT(*)
+        FROM submissions
+        GROUP BY guild_id, DATE_FORMAT(date, '%Y-%m')""")
+    await cursor.execute("""INSERT IGNORE INTO opponent_seasons
+        SELECT opponent_guild, opponent_server, DATE_FORMAT(date, '%Y-%m'),
+            SUM(result = 'Loss'), SUM(result = 'Win'), SUM(result = 'Draw'),
+            COALESCE(SUM(opponent_scored), 0), COUNT(*)
+        FROM submissions
+        WHERE opponent_guild IS NOT NULL AND opponent_server IS NOT NULL
+        GROUP BY opponent_guild, opponent_server, DATE_FORMAT(date, '%Y-%m')""")
+
+
+# Applied in order, each one exactly once, the version reached is kept in
+# schema_version. Only ever append to this list.
+MIGRATIONS = [
+    _create_tables,
+    _create_opponents,
+    _create_indexes,
+    _create_season_stats,
+]
+
+
+async def init_db():
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            # The bot and the scripts in assets/ may start at the same time
+            await cursor.execute("SELECT GET_LOCK('hpn_migrations', 60)")
+            # 0 on timeout, NULL on error, either way the lock isn't ours to release
+            if (await cursor.fetchone())[0] != 1:
+                raise RuntimeError("Could not acquire the migrations lock")
+            try:
+                await cursor.execute(
+                    "CREATE TABLE IF NOT EXISTS schema_version (version INT NOT NULL)"
+                )
+                await cursor.execute("SELECT MAX(version) FROM schema_version")
+                current = (await cursor.fetchone())[0] or 0
+                for version, migration in enumerate(MIGRATIONS, start=1):
+                    if version <= current:
+                        continue
+                    logging.info(f"Applying migration {version}: {migration.__name__}")
+                    await migration(cursor)
+                    await cursor.execute(
+                        "INSERT INTO schema_version (version) VALUES (%s)", (version,)
+                    )
+            finally:
+                await cursor.execute("SELECT RELEASE_LOCK('hpn_migrations')")
+
+
+async def load_date_index():
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "SELECT date, COUNT(*) FROM submissions WHERE date IS NOT NULL GROUP BY date"
+            )
+            rows = await cursor.fetchall()
+    date_index.clear()
+    for day, count in rows:
+        date_index.add(_date_key(day), count)
+
+
+async def load_guild_index():
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute("SELECT id, guild_name, server_number FROM guilds")
+            rows = await cursor.fetchall()
+    guild_index.clear()
+    for row in rows:
+        guild_index.add(row[0], row[1], tuple(row))
+
+
+async def load_opponent_index():
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                "SELECT opponent_guild, opponent_server FROM opponents"
+            )
+            rows = await cursor.fetchall()
+    opponent_index.clear()
+    for guild, server in rows:
+        opponent_index.add((guild, server), guild, (guild, server))
+
+
+async def _track_opponents(cursor, pairs):
+    pairs = [
+        (guild, server) for guild, server in set(pairs) if guild and server is not None
+    ]
+    if not pairs:
+        return
+    await cursor.executemany(
+        "INSERT IGNORE INTO opponents (opponent_guild, opponent_server) VALUES (%s, %s)",
+        pairs,
+    )
+    for pair in pairs:
+        opponent_index.add(pair, pair[0], pair)
+
+
+async def _prune_opponents(cursor, pairs):
+    # Drops opponents that no submission refers to anymore after an overwrite or edit
+    for guild, server in set(pairs):
+        if not guild or server is None:
+            continue
+        await cursor.execute(
+            """DELETE FROM opponents
+            WHERE opponent_guild = %s AND opponent_server = %s
+            AND NOT EXISTS (
+                SELECT 1 FROM submissions
+                WHERE opponent_guild = %s AND opponent_server = %s
+            )""",
+            (guild, server, guild, server),
+        )
+        if cursor.rowcount:
+            opponent_index.remove((guild, server))
+
+
+async def _refresh_seasons(cursor, rows):
+    # Recomputes the season aggregates touched by (guild_id, date, opponent_guild,
+    # opponent_server) rows, each key only reads its own month through an index
+    guild_keys = set()
+    opponent_keys = set()
+    for guild_id, day, opponent_guild, opponent_server in rows:
+        if day is None:
+            continue
+        season = _date_key(day)[:7]
+        if guild_id is not None:
+            guild_keys.add((int(guild_id), season))
+        if opponent_guild and opponent_server is not None:
+            opponent_keys.add((opponent_guild, int(opponent_server), season))
+
+    for guild_id, season in guild_keys:
+        start, end = season_range(season)
+        await cursor.execute(
+            """INSERT INTO guild_seasons
+            SELECT %s, %s,
+                COALESCE(SUM(result = 'Win'), 0),
+                COALESCE(SUM(result = 'Loss'), 0),
+                COALESCE(SUM(result = 'Draw'), 0),
+                COALESCE(SUM(points_scored), 0),
+                COUNT(*)
+            FROM submissions
+            WHERE guild_id = %s AND date >= %s AND date < %s
+            ON DUPLICATE KEY UPDATE
+                wins = VALUES(wins),
+                losses = VALUES(losses),
+                draws = VALUES(draws),
+                points = VALUES(points),
+                submissions = VALUES(submissions)""",
+            (guild_id, season, guild_id, start, end),
+        )
+        await cursor.execute(
+            """DELETE FROM guild_seasons
+            WHERE guild_id = %s AND season = %s AND submissions = 0""",
+            (guild_id, season),
+        )
+
+    for opponent_guild, opponent_server, season in opponent_keys:
+        start, end = season_range(season)
+        await cursor.execute(
+            """INSERT INTO opponent_seasons
+            SELECT %s, %s, %s,
+                COALESCE(SUM(result = 'Loss'), 0),
+                COALESCE(SUM(result = 'Win'), 0),
+                COALESCE(SUM(result = 'Draw'), 0),
+                COALESCE(SUM(opponent_scored), 0),
+                COUNT(*)
+            FROM submissions
+            WHERE opponent_guild = %s AND opponent_server = %s
+            AND date >= %s AND date < %s
+            ON DUPLICATE KEY UPDATE
+                wins = VALUES(wins),
+                losses = VALUES(losses),
+                draws = VALUES(draws),
+                points = VALUES(points),
+                submissions = VALUES(submissions)""",
+            (
+                opponent_guild,
+                opponent_server,
+                season,
+                opponent_guild,
+                opponent_server,
+                start,
+                end,
+            ),
+        )
+        await cursor.execute(
+            """DELETE FROM opponent_seasons
+            WHERE opponent_guild = %s AND opponent_server = %s AND season = %s
+            AND submissions = 0""",
+            (opponent_guild, opponent_server, season),
+        )
+
+
+async def _refresh_guild(cursor, guild_id):
+    await cursor.execute(
+        "SELECT id, guild_name, server_number FROM guilds WHERE id = %s",
+        (guild_id,),
+    )
+    row = await cursor.fetchone()
+    if row is None:
+        guild_index.remove(int(guild_id))
+    else:
+        guild_index.add(row[0], row[1], tuple(row))
 
 
 async def close_db():
@@ -41,23 +516,11 @@ async def get_guild(guild_name, server_number):
 
 
 async def get_guilds_from_name(current):
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute(
-                "SELECT id, guild_name, server_number FROM guilds WHERE guild_name LIKE %s LIMIT 25",
-                (f"%{current}%",),
-            )
-            return await cursor.fetchall()
+    return guild_index.search(current)
 
 
 async def get_opponent_guilds_from_name(current):
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute(
-                "SELECT DISTINCT opponent_guild, opponent_server FROM submissions WHERE opponent_guild LIKE %s LIMIT 25",
-                (f"%{current}%",),
-            )
-            return await cursor.fetchall()
+    return opponent_index.search(current)
 
 
 async def get_guild_by_id(guild):
@@ -86,6 +549,11 @@ async def add_guild(
                     return False
                 else:
                     raise e
+            guild_index.add(
+                cursor.lastrowid,
+                guild_name,
+                (cursor.lastrowid, guild_name, server_number),
+            )
             return True
 
 
@@ -100,14 +568,31 @@ async def add_member(member, guild_id):
             )
 
 
-async def remove_inactive_members(active_user_ids):
+async def sync_members(active_user_ids) -> int:
+    active_user_ids = {int(uid) for uid in active_user_ids}
+    # An empty member list means the fetch failed, not that everyone left
+    if not active_user_ids:
+        return 0
     async with pool.acquire() as conn:
         async with conn.cursor() as cursor:
-            await cursor.execute(
-                """DELETE FROM members
-                WHERE user_id NOT IN (%s)""",
-                (",".join(str(uid) for uid in active_user_ids),),
-            )
+            # Temporary tables are per connection, the pooled one may still have it
+            await cursor.execute("DROP TEMPORARY TABLE IF EXISTS active_members")
+            await cursor.execute("""CREATE TEMPORARY TABLE active_members (
+                    user_id BIGINT PRIMARY KEY
+                ) ENGINE = MEMORY""")
+            try:
+                # executemany folds this into multi-row INSERTs split under the
+                # packet size, a few statements for tens of thousands of ids
+                await cursor.executemany(
+                    "INSERT INTO active_members (user_id) VALUES (%s)",
+                    [(uid,) for uid in active_user_ids],
+                )
+                await cursor.execute("""DELETE m FROM members m
+                    LEFT JOIN active_members a ON a.user_id = m.user_id
+                    WHERE a.user_id IS NULL""")
+                return cursor.rowcount
+            finally:
+                await cursor.execute("DROP TEMPORARY TABLE IF EXISTS active_members")
 
 
 async def get_inactive_members() -> list[int]:
@@ -136,6 +621,14 @@ async def add_submission(
 ):
     async with pool.acquire() as conn:
         async with conn.cursor() as cursor:
+            await cursor.execute(
+                """SELECT m.guild_id, s.date, s.opponent_guild, s.opponent_server
+                FROM members m
+                LEFT JOIN submissions s ON s.guild_id = m.guild_id AND s.date = %s
+                WHERE m.user_id = %s""",
+                (date, submitted_by),
+            )
+            member = await cursor.fetchone()
             await cursor.execute(
                 """INSERT INTO submissions (
                     guild_id, points_scored, opponent_server, opponent_guild,
@@ -166,9 +659,25 @@ async def add_submission(
                     submitted_by,
                 ),
             )
+            # Read these before the follow-up statements below overwrite them
+            lastrowid, rowcount = cursor.lastrowid, cursor.rowcount
+            _added_dates(date)
+            # 1 for a new row, 2 when an existing one was overwritten
+            if rowcount == 1 and date is not None:
+                date_index.add(_date_key(date))
+            if member is not None:
+                replaced = {tuple(member[2:])} if member[1] is not None else set()
+                await _track_opponents(cursor, [(opponent_guild, opponent_server)])
+                await _prune_opponents(
+                    cursor, replaced - {(opponent_guild, opponent_server)}
+                )
+                await _refresh_seasons(
+                    cursor,
+                    [member, (member[0], date, opponent_guild, opponent_server)],
+                )
 
-            if cursor.lastrowid:
-                return cursor.lastrowid
+            if lastrowid:
+                return lastrowid
             else:
                 await cursor.execute(
                     """SELECT id FROM submissions
@@ -179,6 +688,79 @@ async def add_submission(
                 return row[0] if row else None
 
 
+async def add_submissions(submissions: list[dict], submitted_by) -> list[int | None]:
+    rows = [
+        (
+            submission["guild_id"],
+            submission["points_scored"],
+            submission["opponent_server"],
+            submission["opponent_guild"],
+            submission["opponent_scored"],
+            submission["date"],
+            submission["total_points"],
+            submission["league"],
+            submission["division"],
+            submitted_by,
+        )
+        for submission in submissions
+    ]
+    if not rows:
+        return []
+
+    keys = [(row[0], row[5]) for row in rows]
+    where = " OR ".join(["(guild_id = %s AND date = %s)"] * len(keys))
+    params = [value for key in keys for value in key]
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(
+                f"""SELECT guild_id, date, opponent_guild, opponent_server
+                FROM submissions WHERE {where}""",
+                params,
+            )
+            existing = await cursor.fetchall()
+            replaced = {tuple(row[2:]) for row in existing}
+            # executemany folds this into a single multi-row INSERT
+            await cursor.executemany(
+                """INSERT INTO submissions (
+                    guild_id, points_scored, opponent_server, opponent_guild,
+                    opponent_scored, date, total_points, league, division, submitted_by
+                )
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    points_scored = VALUES(points_scored),
+                    opponent_server = VALUES(opponent_server),
+                    opponent_guild = VALUES(opponent_guild),
+                    opponent_scored = VALUES(opponent_scored),
+                    total_points = VALUES(total_points),
+                    league = VALUES(league),
+                    division = VALUES(division),
+                    submitted_by = VALUES(submitted_by)""",
+                rows,
+            )
+            _added_dates(*{row[5] for row in rows})
+            added = {(row[3], row[2]) for row in rows}
+            await _track_opponents(cursor, added)
+            await _prune_opponents(cursor, replaced - added)
+            await _refresh_seasons(
+                cursor, list(existing) + [(r[0], r[5], r[3], r[2]) for r in rows]
+            )
+            overwritten = {(int(row[0]), _date_key(row[1])) for row in existing}
+            for guild_id, day in {
+                (int(g), _date_key(d)) for g, d in keys if d is not None
+            }:
+                if (guild_id, day) not in overwritten:
+                    date_index.add(day)
+
+            await cursor.execute(
+                f"SELECT id, guild_id, date FROM submissions WHERE {where}", params
+            )
+            ids = {
+                (guild_id, str(date)): id_
+                for id_, guild_id, date in await cursor.fetchall()
+            }
+            return [ids.get((int(guild_id), str(date))) for guild_id, date in keys]
+
+
 async def edit_label(record_id: int, label: str, new_value) -> bool:
     async with pool.acquire() as conn:
         async with conn.cursor() as cursor:
@@ -194,6 +776,12 @@ async def edit_label(record_id: int, label: str, new_value) -> bool:
             }:
                 raise ValueError(f"Invalid label: {label}")
 
+            select = """SELECT guild_id, date, opponent_guild, opponent_server
+                FROM submissions WHERE id = %s"""
+            await cursor.execute(select, (record_id,))
+            old = await cursor.fetchone()
+            old_date = old[1] if old is not None else None
+
             query = f"UPDATE submissions SET {label} = %s WHERE id = %s"
             try:
                 await cursor.execute(query, (new_value, record_id))
@@ -202,54 +790,154 @@ async def edit_label(record_id: int, label: str, new_value) -> bool:
                     await cursor.execute(
                         "DELETE FROM submissions WHERE id = %s", (record_id,)
                     )
+                    invalidate_leaderboard(old_date)
+                    if old is not None:
+                        date_index.remove(_date_key(old_date))
+                        await _prune_opponents(cursor, [tuple(old[2:])])
+                        await _refresh_seasons(cursor, [old])
                     return False
                 else:
                     raise e
+            if label in LEADERBOARD_LABELS:
+                invalidate_leaderboard(old_date, new_value, latest=label == "date")
+            if old is None or label not in SEASON_LABELS:
+                return True
+
+            await cursor.execute(select, (record_id,))
+            new = await cursor.fetchone()
+            if label == "date":
+                date_index.remove(_date_key(old_date))
+                date_index.add(_date_key(new[1]))
+            if label in OPPONENT_LABELS:
+                await _track_opponents(cursor, [tuple(new[2:])])
+                if tuple(new[2:]) != tuple(old[2:]):
+                    await _prune_opponents(cursor, [tuple(old[2:])])
+            await _refresh_seasons(cursor, [old, new])
             return True
 
 
-async def get_leaderboard(date):
+async def get_leaderboard_count(date) -> int:
+    key = _date_key(date)
+    cached = _cached(key, None)
+    if cached is not None:
+        return cached
+    generation = cache_generation
+
     async with pool.acquire() as conn:
         async with conn.cursor() as cursor:
             await cursor.execute(
-                """SELECT server_number, guild_name, total_points, league, division, RANK() OVER (ORDER BY total_points DESC)
-                FROM submissions
-                JOIN guilds ON guilds.id = guild_id
-                WHERE date = %s;""",
-                (date,),
+                "SELECT COUNT(*) FROM submissions WHERE date = %s", (date,)
             )
-            return await cursor.fetchall()
-
-
-async def get_date(current):
+            (count,) = await cursor.fetchone()
+    _cache(key, None, count, (), generation)
+    return count
+
+
+async def get_leaderboard_page(
+    date, after=None, before=None, last=False, limit=PAGE_SIZE
+) -> tuple[tuple, tuple | None, tuple | None]:
+    key = _date_key(date)
+    page_key = (after, before, last, limit)
+    cached = _cached(key, page_key)
+    if cached is not None:
+        return cached
+    generation = cache_generation
+
+    columns = ("total_points", "guild_id")
+    query, params, backwards = _keyset(
+        """SELECT guild_id, server_number, guild_name, total_points, league, division
+        FROM submissions
+        JOIN guilds ON guilds.id = guild_id
+        WHERE date = %s""",
+        [date],
+        columns,
+        after,
+        before,
+        last,
+        limit,
+    )
     async with pool.acquire() as conn:
         async with conn.cursor() as cursor:
-            await cursor.execute(
-                "SELECT DISTINCT date FROM submissions WHERE date LIKE %s ORDER BY date DESC LIMIT 25; ",
-                (f"%{current}%",),
-            )
-            return await cursor.fetchall()
+            await cursor.execute(query, params)
+            result = await cursor.fetchall()
+            if backwards:
+                result = result[::-1]
+
+            # Cursors also carry the rank and position of their row, so going forward
+            # the ranks follow from the previous page. Going backwards only the rows
+            # ahead of the page are counted, once, on idx_submissions_leaderboard.
+            ahead = greater = 0
+            if result and after is not None:
+                ahead = after[3]
+                greater = after[2] - 1 if result[0][3] == after[0] else ahead
+            elif result and (before is not None or last):
+                points, guild_id = result[0][3], result[0][0]
+                condition, values = _before(columns, (points, guild_id))
+                higher = (
+                    "total_points > %s"
+                    if points is not None
+                    else "total_points IS NOT NULL"
+                )
+                await cursor.execute(
+                    f"""SELECT COUNT(*), COALESCE(SUM({higher}), 0)
+                    FROM submissions WHERE date = %s AND {condition}""",
+                    [points] * (points is not None) + [date, *values],
+                )
+                ahead, greater = (int(value) for value in await cursor.fetchone())
+
+    rows = []
+    rank = greater + 1
+    for position, row in enumerate(result, start=ahead + 1):
+        if rows and row[3] != rows[-1][3]:
+            rank = position
+        rows.append((*row, rank, position))
+    page = (
+        tuple(row[1:7] for row in rows),
+        (rows[0][3], rows[0][0], rows[0][6], rows[0][7]) if rows else None,
+        (rows[-1][3], rows[-1][0], rows[-1][6], rows[-1][7]) if rows else None,
+    )
+    _cache(key, page_key, page, {row[0] for row in result}, generation)
+    return page
+
+
+async def get_date(current) -> list[str]:
+    return date_index.search(current)
 
 
 async def get_latest_date():
+    global latest_date_cache
+    if latest_date_cache is not _UNSET:
+        cache_stats["latest_date_hit"] += 1
+        return latest_date_cache
+    cache_stats["latest_date_miss"] += 1
+    generation = cache_generation
+
     async with pool.acquire() as conn:
         async with conn.cursor() as cursor:
             await cursor.execute("SELECT MAX(date) FROM submissions;")
             res = await cursor.fetchone()
+            if generation == cache_generation:
+                latest_date_cache = res[0]
             return res[0]
 
 
-async def get_records_data(
-    guild_data: str | list[str, int], season: str = None, opponent=False
-):
+async def get_records_page(
+    guild_data: str | list[str, int],
+    season: str = None,
+    opponent=False,
+    after=None,
+    before=None,
+    last=False,
+    limit=PAGE_SIZE,
+) -> tuple[list[tuple], tuple | None, tuple | None]:
     if opponent:
-        query = """SELECT server_number, guild_name, opponent_scored, points_scored, date, result
+        query = """SELECT server_number, guild_name, opponent_scored, points_scored, date, result, submissions.id
         FROM submissions
         JOIN guilds ON guilds.id = guild_id
         WHERE opponent_guild = %s AND opponent_server = %s"""
-        params = guild_data
+        params = list(guild_data)
     else:
-        query = """SELECT opponent_server, opponent_guild, points_scored, opponent_scored, date, result
+        query = """SELECT opponent_server, opponent_guild, points_scored, opponent_scored, date, result, submissions.id
         FROM submissions
         WHERE guild_id = %s"""
         params = [
@@ -257,16 +945,62 @@ async def get_records_data(
         ]
 
     if season is not None:
-        year, month = season.split("-")
-        query += " AND YEAR(date) = %s AND MONTH(date) = %s"
-        params.extend([year, month])
+        query += " AND date >= %s AND date < %s"
+        params.extend(season_range(season))
 
-    query += " ORDER BY date DESC"
+    query, params, backwards = _keyset(
+        query, params, ("date", "submissions.id"), after, before, last, limit
+    )
 
     async with pool.acquire() as conn:
         async with conn.cursor() as cursor:
             await cursor.execute(query, params)
-            return await cursor.fetchall()
+            result = await cursor.fetchall()
+
+    if backwards:
+        result = result[::-1]
+    return (
+        [row[:6] for row in result],
+        (result[0][4], result[0][6]) if result else None,
+        (result[-1][4], result[-1][6]) if result else None,
+    )
+
+
+async def get_records_stats(
+    guild_data: str | list[str, int], season: str = None, opponent=False
+) -> dict | None:
+    if opponent:
+        query = """SELECT season, wins, losses, draws, points, submissions
+        FROM opponent_seasons
+        WHERE opponent_guild = %s AND opponent_server = %s"""
+        params = list(guild_data)
+    else:
+        query = """SELECT season, wins, losses, draws, points, submissions
+        FROM guild_seasons
+        WHERE guild_id = %s"""
+        params = [guild_data]
+
+    if season is not None:
+        query += " AND season = %s"
+        params.append(season)
+    query += " ORDER BY season DESC"
+
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(query, params)
+            rows = await cursor.fetchall()
+    if not rows:
+        return None
+    return {
+        "results": {
+            "Win": sum(row[1] for row in rows),
+            "Loss": sum(row[2] for row in rows),
+            "Draw": sum(row[3] for row in rows),
+        },
+        "points": sum(row[4] for row in rows),
+        "submissions": sum(row[5] for row in rows),
+        "seasons": [row[0] for row in rows],
+    }
 
 
 async def get_missing_submissions(since):
@@ -360,7 +1094,10 @@ async def rename_guild(guild_id, new_name):
                     guild_id,
                 ),
             )
-            return cursor.rowcount > 0
+            updated = cursor.rowcount > 0
+            invalidate_guild(guild_id)
+            await _refresh_guild(cursor, guild_id)
+            return updated
 
 
 async def reset_guild_server(guild_id, new_server):
@@ -373,14 +1110,36 @@ async def reset_guild_server(guild_id, new_server):
                     guild_id,
                 ),
             )
-            return cursor.rowcount > 0
+            updated = cursor.rowcount > 0
+            invalidate_guild(guild_id)
+            await _refresh_guild(cursor, guild_id)
+            return updated
 
 
 async def delete_guild_from_db(guild_id):
     async with pool.acquire() as conn:
         async with conn.cursor() as cursor:
+            await cursor.execute(
+                """SELECT DISTINCT NULL, date, opponent_guild, opponent_server
+                FROM submissions WHERE guild_id = %s""",
+                (guild_id,),
+            )
+            faced = await cursor.fetchall()
             await cursor.execute(
                 "DELETE FROM guilds WHERE id = %s",
                 (guild_id,),
             )
-            return cursor.rowcount > 0
+            invalidate_guild(guild_id)
+            # Its submissions may have gone with it
+            invalidate_leaderboard(*{row[1] for row in faced})
+            guild_index.remove(int(guild_id))
+            deleted = cursor.rowcount > 0
+            if deleted:
+                await cursor.execute(
+                    "DELETE FROM guild_seasons WHERE guild_id = %s", (guild_id,)
+                )
+                await _prune_opponents(cursor, [tuple(row[2:]) for row in faced])
+                await _refresh_seasons(cursor, faced)
+    if deleted:
+        await load_date_index()
+    return deleted
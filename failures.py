@@ -0,0 +1,82 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FAILS_DIR = os.getenv("FAILS_DIR", "fails")
+INDEX_FILE = "index.jsonl"
+
+_lock = threading.Lock()
+
+
+class ExtractionFailed(Exception):
+    def __init__(self, error: BaseException, partial: dict):
+        super().__init__(repr(error))
+        self.error = error
+        self.partial = partial
+
+
+def _extension(img_bytes: bytes) -> str:
+    if img_bytes.startswith(b"\x89PNG"):
+        return "png"
+    if img_bytes.startswith(b"\xff\xd8"):
+        return "jpg"
+    if img_bytes[:4] == b"RIFF" and img_bytes[8:12] == b"WEBP":
+        return "webp"
+    return "bin"
+
+
+def _store_image(img_bytes: bytes | None, directory: str) -> str | None:
+    if not img_bytes:
+        return None
+    filename = f"{hashlib.sha256(img_bytes).hexdigest()}.{_extension(img_bytes)}"
+    path = os.path.join(directory, filename)
+    # Content addressed, a resubmitted failure is only stored once
+    if not os.path.exists(path):
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as file:
+            file.write(img_bytes)
+        os.replace(tmp, path)
+    return filename
+
+
+def record_failure(
+    war_bytes, league_bytes, user_id, error, partial=None, directory=FAILS_DIR
+) -> dict:
+    os.makedirs(directory, exist_ok=True)
+    entry = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "user_id": user_id,
+        "error": repr(error),
+        "war": _store_image(war_bytes, directory),
+        "league": _store_image(league_bytes, directory),
+        "partial": partial or {},
+    }
+    line = json.dumps(entry, default=str, ensure_ascii=False)
+    with _lock, open(
+        os.path.join(directory, INDEX_FILE), "a", encoding="utf-8"
+    ) as file:
+        file.write(line + "\n")
+    return entry
+
+
+async def save_failure(war_bytes, league_bytes, user_id, error, partial=None):
+    return await asyncio.to_thread(
+        record_failure, war_bytes, league_bytes, user_id, error, partial
+    )
+
+
+def iter_failures(directory=FAILS_DIR):
+    path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", 500))
+
+# Rolling window of the last METRICS_WINDOW durations (seconds) of every stage. OCR
+# workers record into their own copy, drain() it with each result and the parent
+# merge()s the samples back so everything ends up in the process that is queried.
+samples: dict[str, deque[float]] = defaultdict(lambda: deque(maxlen=METRICS_WINDOW))
+_lock = threading.Lock()
+
+
+def record(stage: str, seconds: float):
+    with _lock:
+        samples[stage].append(seconds)
+
+
+@contextmanager
+def timer(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def drain() -> dict[str, list[float]]:
+    with _lock:
+        drained = {stage: list(values) for stage, values in samples.items() if values}
+        samples.clear()
+    return drained
+
+
+def merge(drained: dict[str, list[float]]):
+    with _lock:
+        for stage, values in drained.items():
+            samples[stage].extend(values)
+
+
+def snapshot() -> dict[str, list[float]]:
+    with _lock:
+        return {stage: list(values) for stage, values in samples.items() if values}
+
+
+def _percentile(ordered, q):
+    # Nearest rank, good enough for a few hundred samples and no numpy in the bot
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def summarize(values: list[float]) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(v * 1000 for v in values)
+    return {
+        "n": len(ordered),
+        "p50": round(_percentile(ordered, 50), 2),
+        "p90": round(_percentile(ordered, 90), 2),
+        "p99": round(_percentile(ordered, 99), 2),
+        "max": round(ordered[-1], 2),
+    }
+
+
+def summary() -> dict[str, dict]:
+    return {stage: summarize(values) for stage, values in sorted(snapshot().items())}
+
+
+def format_summary(stats: dict[str, dict]) -> str:
+    lines = [f"{'stage':<24}{'n':>6}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}"]
+    for stage, stage_stats in stats.items():
+        lines.append(
+            f"{stage:<24}{stage_stats['n']:>6}{stage_stats['p50']:>10}"
+            f"{stage_stats['p90']:>10}{stage_stats['p99']:>10}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,136 @@
+import logging
+import os
+import threading
+
+import numpy as np
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+OCR_BACKEND = os.getenv("OCR_BACKEND", "tesserocr" if tesserocr else "tesseract")
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+
+_backend = None
+
+
+class OCRBackend:
+    name: str
+
+    def warm(self):
+        pass
+
+    def image_to_string(self, image, config: str = "") -> str:
+        raise NotImplementedError
+
+    def image_to_data(self, image, config: str = "") -> dict[str, list]:
+        raise NotImplementedError
+
+
+class TesseractBackend(OCRBackend):
+    name = "tesseract"
+
+    def warm(self):
+        pytesseract.get_tesseract_version()
+
+    def image_to_string(self, image, config=""):
+        return pytesseract.image_to_string(image, lang=OCR_LANG, config=config)
+
+    def image_to_data(self, image, config=""):
+        data = pytesseract.image_to_data(
+            image, lang=OCR_LANG, config=config, output_type=pytesseract.Output.DICT
+        )
+        words = [n for n, level in enumerate(data["level"]) if level == 5]
+        result = {
+            key: [data[key][n] for n in words]
+            for key in ("text", "left", "top", "width", "height")
+        }
+        result["conf"] = [float(data["conf"][n]) for n in words]
+        return result
+
+
+class TesserocrBackend(OCRBackend):
+    name = "tesserocr"
+
+    def __init__(self):
+        # One engine per thread, the language model is loaded once and reused for every crop
+        self._local = threading.local()
+
+    @property
+    def api(self):
+        api = getattr(self._local, "api", None)
+        if api is None:
+            api = tesserocr.PyTessBaseAPI(lang=OCR_LANG)
+            self._local.api = api
+        return api
+
+    def warm(self):
+        self.api
+
+    def _set_image(self, image, config):
+        api = self.api
+        api.Clear()
+        psm, variables = _parse_config(config)
+        api.SetPageSegMode(psm if psm is not None else tesserocr.PSM.SINGLE_BLOCK)
+        api.SetVariable("tessedit_char_whitelist", "")
+        for key, value in variables.items():
+            api.SetVariable(key, value)
+        if isinstance(image, np.ndarray):
+            image = np.ascontiguousarray(image)
+            height, width = image.shape[:2]
+            depth = image.shape[2] if image.ndim == 3 else 1
+            api.SetImageBytes(image.tobytes(), width, height, depth, width * depth)
+        else:
+            api.SetImage(image)
+        return api
+
+    def image_to_string(self, image, config=""):
+        return self._set_image(image, config).GetUTF8Text()
+
+    def image_to_data(self, image, config=""):
+        api = self._set_image(image, config)
+        api.Recognize()
+        data = {key: [] for key in ("text", "left", "top", "width", "height", "conf")}
+        level = tesserocr.RIL.WORD
+        for word in tesserocr.iterate_level(api.GetIterator(), level):
+            box = word.BoundingBox(level)
+            if box is None:
+                continue
+            x1, y1, x2, y2 = box
+            data["text"].append(word.GetUTF8Text(level) or "")
+            data["left"].append(x1)
+            data["top"].append(y1)
+            data["width"].append(x2 - x1)
+            data["height"].append(y2 - y1)
+            data["conf"].append(word.Confidence(level))
+        return data
+
+
+def _parse_config(config: str) -> tuple[int | None, dict[str, str]]:
+    psm = None
+    variables = {}
+    args = config.split()
+    for n, arg in enumerate(args):
+        if arg == "--psm" and n + 1 < len(args):
+            psm = int(args[n + 1])
+        elif arg == "-c" and n + 1 < len(args):
+            key, _, value = args[n + 1].partition("=")
+            variables[key] = value
+    return psm, variables
+
+
+def get_backend() -> OCRBackend:
+    global _backend
+    if _backend is None:
+        if OCR_BACKEND == "tesserocr" and tesserocr is not None:
+            try:
+                _backend = TesserocrBackend()
+                _backend.warm()
+            except Exception as e:
+                logging.error(f"tesserocr unavailable, falling back to tesseract: {e}")
+                _backend = TesseractBackend()
+        else:
+            _backend = TesseractBackend()
+    return _backend
@@ -0,0 +1,124 @@
+import hashlib
+import logging
+import os
+import pickle
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", 256))
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR")
+OCR_CACHE_PHASH = os.getenv("OCR_CACHE_PHASH", "1") == "1"
+PHASH_DISTANCE = int(os.getenv("OCR_CACHE_PHASH_DISTANCE", 32))
+PHASH_SIZE = (64, 32)
+PHASH_THRESHOLD = 8
+# A perceptual hash alone can't tell a re-encoded copy from the same game screen with
+# one different digit, near matches are confirmed on a small thumbnail where a changed
+# glyph shows up as a sharp local difference and compression noise doesn't
+THUMB_SIZE = (320, 144)
+THUMB_TOLERANCE = int(os.getenv("OCR_CACHE_THUMB_TOLERANCE", 24))
+
+
+def content_hash(img_bytes: bytes) -> str:
+    return hashlib.sha256(img_bytes).hexdigest()
+
+
+def fingerprint(img_bytes: bytes) -> tuple[int, np.ndarray, float] | None:
+    img_array = np.frombuffer(img_bytes, np.uint8)
+    image = cv2.imdecode(img_array, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if image is None:
+        return None
+    W, H = PHASH_SIZE
+    small = cv2.resize(image, (W + 1, H), interpolation=cv2.INTER_AREA)
+    diff = small[:, 1:].astype(np.int16) - small[:, :-1]
+    bits = np.packbits(
+        np.concatenate(
+            [(diff > PHASH_THRESHOLD).flatten(), (diff < -PHASH_THRESHOLD).flatten()]
+        )
+    )
+    thumb = cv2.resize(image, THUMB_SIZE, interpolation=cv2.INTER_AREA)
+    return int.from_bytes(bits.tobytes(), "big"), thumb, image.shape[1] / image.shape[0]
+
+
+class OCRCache:
+    def __init__(self, size=OCR_CACHE_SIZE, directory=OCR_CACHE_DIR):
+        self.size = size
+        self.directory = directory
+        self.entries: OrderedDict[tuple[str, str], tuple[tuple | None, dict]] = (
+            OrderedDict()
+        )
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+
+    def _path(self, key):
+        kind, digest = key
+        return os.path.join(self.directory, f"{kind}-{digest}.pkl")
+
+    def _load(self):
+        files = [
+            os.path.join(self.directory, fp)
+            for fp in os.listdir(self.directory)
+            if fp.endswith(".pkl")
+        ]
+        files.sort(key=os.path.getmtime)
+        for path in files[-self.size :]:
+            kind, _, digest = os.path.basename(path).removesuffix(".pkl").partition("-")
+            try:
+                with open(path, "rb") as file:
+                    self.entries[(kind, digest)] = pickle.load(file)
+            except Exception as e:
+                logging.error(f"Dropping unreadable OCR cache entry {path}: {e}")
+                os.remove(path)
+        for path in files[: -self.size]:
+            os.remove(path)
+
+    def get(self, kind, digest) -> dict | None:
+        key = (kind, digest)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        if self.directory:
+            try:
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                # Pruned outside of this process, the entry in memory is still valid
+                pass
+        return entry[1]
+
+    def get_similar(self, kind, fp) -> tuple[str, dict] | None:
+        if fp is None:
+            return None
+        phash, thumb, ratio = fp
+        candidates = []
+        for key, (entry_fp, _) in self.entries.items():
+            if key[0] != kind or entry_fp is None:
+                continue
+            entry_phash, entry_thumb, entry_ratio = entry_fp
+            distance = (entry_phash ^ phash).bit_count()
+            if distance <= PHASH_DISTANCE and abs(entry_ratio - ratio) < 0.01:
+                candidates.append((distance, key, entry_thumb))
+        for _, key, entry_thumb in sorted(candidates, key=lambda c: c[0]):
+            if cv2.absdiff(thumb, entry_thumb).max() <= THUMB_TOLERANCE:
+                return key[1], self.get(*key)
+        return None
+
+    def put(self, kind, digest, fp, result):
+        key = (kind, digest)
+        self.entries[key] = (fp, result)
+        self.entries.move_to_end(key)
+        if self.directory:
+            with open(self._path(key), "wb") as file:
+                pickle.dump((fp, result), file)
+        while len(self.entries) > self.size:
+            old_key, _ = self.entries.popitem(last=False)
+            if self.directory:
+                try:
+                    os.remove(self._path(old_key))
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from dotenv import load_dotenv
+
+import metrics
+import ocr_service
+
+load_dotenv()
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+MAX_ATTACHMENT_SIZE = int(os.getenv("MAX_ATTACHMENT_SIZE", 8 * 1024 * 1024))
+
+executor: ProcessPoolExecutor = None
+pool_size = OCR_WORKERS
+cache = None
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+def _warm_worker():
+    import cv2
+
+    import screenshots  # noqa: F401
+    from ocr_backend import get_backend
+
+    cv2.setNumThreads(1)
+    try:
+        get_backend().warm()
+    except Exception as e:
+        logging.error(f"OCR engine unavailable in worker {os.getpid()}: {e}")
+
+
+def _run(kind, img_bytes):
+    import screenshots
+
+    if kind == "war":
+        result = screenshots.extract_war(img_bytes)
+    else:
+        result = screenshots.extract_league(img_bytes)
+    # Stage timings recorded in this worker travel back with the result
+    return result, metrics.drain()
+
+
+def start_ocr(workers=OCR_WORKERS):
+    # With the OCR service running the bot never loads cv2 or tesseract itself, the
+    # local pool is only started if the service can't be reached
+    if ocr_service.OCR_SERVICE and ocr_service.available():
+        logging.info(f"Using the OCR service at {ocr_service.OCR_SOCKET}")
+        return
+    start_local(workers)
+
+
+def start_local(workers=OCR_WORKERS):
+    global executor, cache, pool_size
+    from ocr_cache import OCRCache
+
+    cache = OCRCache()
+    pool_size = workers
+    executor = _new_executor(workers)
+    logging.info(f"OCR pool started with {workers} workers")
+
+
+def _new_executor(workers=OCR_WORKERS) -> ProcessPoolExecutor:
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_warm_worker)
+    # Workers are spawned lazily, submitting no-ops forces them up before the first /submit
+    for _ in range(workers):
+        pool.submit(int)
+    return pool
+
+
+async def _run_in_pool(func, *args):
+    # A worker killed by the OOM killer or a crashing engine breaks the whole pool,
+    # it is replaced once instead of failing every later submission
+    global executor
+    loop = asyncio.get_running_loop()
+    broken = executor
+    try:
+        return await loop.run_in_executor(broken, func, *args)
+    except BrokenProcessPool:
+        if executor is broken:
+            logging.error("OCR pool broke, starting a new one")
+            broken.shutdown(wait=False, cancel_futures=True)
+            executor = _new_executor(pool_size)
+    return await loop.run_in_executor(executor, func, *args)
+
+
+def stop_ocr():
+    global executor
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+        executor = None
+
+
+async def _extract(kind, img_bytes):
+    if ocr_service.OCR_SERVICE:
+        try:
+            return await ocr_service.request(kind, img_bytes)
+        except ocr_service.ServiceUnavailable as e:
+            if executor is None:
+                logging.warning(f"OCR service unavailable, extracting in process: {e}")
+    if executor is None:
+        start_local()
+    return await extract_local(kind, img_bytes)
+
+
+async def extract_local(kind, img_bytes):
+    from ocr_cache import OCR_CACHE_PHASH, content_hash, fingerprint
+
+    digest = content_hash(img_bytes)
+    result = cache.get(kind, digest)
+    if result is not None:
+        logging.info(f"OCR cache hit for {kind} screenshot {digest[:12]}")
+        return result
+
+    fp = None
+    if OCR_CACHE_PHASH:
+        with metrics.timer("fingerprint"):
+            fp = await _run_in_pool(fingerprint, img_bytes)
+        similar = cache.get_similar(kind, fp)
+        if similar is not None:
+            similar_digest, result = similar
+            logging.info(
+                f"OCR cache perceptual hit for {kind} screenshot {digest[:12]} (matches {similar_digest[:12]})"
+            )
+            cache.put(kind, digest, fp, result)
+            return result
+
+    result, samples = await _run_in_pool(_run, kind, img_bytes)
+    metrics.merge(samples)
+    cache.put(kind, digest, fp, result)
+    return result
+
+
+async def remote_timings() -> dict[str, dict]:
+    # With the OCR service running the extraction stages are recorded in its process
+    if not ocr_service.OCR_SERVICE:
+        return {}
+    try:
+        return await ocr_service.fetch_metrics()
+    except (
+        ocr_service.ServiceUnavailable,
+        ocr_service.RemoteExtractionError,
+        ValueError,
+    ):
+        return {}
+
+
+async def extract_war(img_bytes):
+    return await _extract("war", img_bytes)
+
+
+async def extract_league(img_bytes):
+    return await _extract("league", img_bytes)
+
+
+def check_attachment(attachment):
+    # Attachment.size comes with the interaction, oversized files are never downloaded
+    if attachment.size > MAX_ATTACHMENT_SIZE:
+        raise AttachmentTooLarge(
+            f"{attachment.filename} is {attachment.size / 1024 / 1024:.1f} MB"
+        )
+
+
+async def read_attachment(attachment) -> bytes:
+    check_attachment(attachment)
+    return await attachment.read()
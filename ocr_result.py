@@ -0,0 +1,37 @@
+import os
+from datetime import date
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+OCR_RETRY_CONF = float(os.getenv("OCR_RETRY_CONF", 60))
+
+
+class OCRResult(dict):
+    # Still a plain mapping of the extracted fields so callers can keep unpacking it,
+    # with the 0-100 confidence of every field and the ones that stayed below
+    # OCR_RETRY_CONF even after the second pass
+    def __init__(self, fields, confidence):
+        super().__init__(fields)
+        self.confidence = confidence
+        self.uncertain = [
+            key for key, conf in confidence.items() if conf < OCR_RETRY_CONF
+        ]
+
+    def to_json(self) -> dict:
+        return {
+            "fields": {
+                key: value.isoformat() if isinstance(value, date) else value
+                for key, value in self.items()
+            },
+            "dates": [key for key, value in self.items() if isinstance(value, date)],
+            "confidence": self.confidence,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "OCRResult":
+        fields = data["fields"]
+        for key in data["dates"]:
+            fields[key] = date.fromisoformat(fields[key])
+        return cls(fields, data["confidence"])
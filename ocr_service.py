@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+
+from dotenv import load_dotenv
+
+import metrics
+from ocr_result import OCRResult
+
+load_dotenv()
+
+OCR_SERVICE = os.getenv("OCR_SERVICE", "1") == "1"
+OCR_SOCKET = os.getenv("OCR_SOCKET", "ocr.sock")
+OCR_SERVICE_TIMEOUT = float(os.getenv("OCR_SERVICE_TIMEOUT", 120))
+MAX_HEADER_SIZE = 64 * 1024
+
+# Protocol: one request per connection. Both sides send a 4 byte big endian header
+# length, the JSON header, then header["size"] bytes of payload. Requests are
+# {"kind": "war" | "league", "size": n} followed by the screenshot, responses are
+# {"ok": true, "result": OCRResult.to_json()} or {"ok": false, "error": "..."}.
+# {"kind": "metrics"} is answered with {"ok": true, "stages": metrics.summary()}, the
+# percentiles rather than the raw windows so the header stays small.
+
+
+class ServiceUnavailable(Exception):
+    pass
+
+
+class RemoteExtractionError(Exception):
+    pass
+
+
+async def _read_message(reader: asyncio.StreamReader, max_size=None):
+    length = int.from_bytes(await reader.readexactly(4), "big")
+    if length > MAX_HEADER_SIZE:
+        raise ValueError(f"Header too large ({length} bytes)")
+    header = json.loads(await reader.readexactly(length))
+    size = header.get("size", 0)
+    if max_size is not None and size > max_size:
+        raise ValueError(f"Payload too large ({size} bytes)")
+    payload = await reader.readexactly(size) if size else b""
+    return header, payload
+
+
+def _write_message(writer: asyncio.StreamWriter, header: dict, payload=b""):
+    data = json.dumps(header).encode()
+    writer.write(len(data).to_bytes(4, "big") + data)
+    if payload:
+        writer.write(payload)
+
+
+def available(path=OCR_SOCKET) -> bool:
+    if not os.path.exists(path):
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+async def _call(header, payload, path, timeout) -> dict:
+    try:
+        reader, writer = await asyncio.open_unix_connection(path)
+    except OSError as e:
+        raise ServiceUnavailable(e) from e
+    try:
+        _write_message(writer, {**header, "size": len(payload)}, payload)
+        await writer.drain()
+        response, _ = await asyncio.wait_for(_read_message(reader), timeout)
+    except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+        raise ServiceUnavailable(e) from e
+    finally:
+        writer.close()
+
+    if not response["ok"]:
+        raise RemoteExtractionError(response["error"])
+    return response
+
+
+async def request(kind, img_bytes, path=OCR_SOCKET, timeout=OCR_SERVICE_TIMEOUT):
+    response = await _call({"kind": kind}, img_bytes, path, timeout)
+    return OCRResult.from_json(response["result"])
+
+
+async def fetch_metrics(path=OCR_SOCKET, timeout=5) -> dict[str, dict]:
+    response = await _call({"kind": "metrics"}, b"", path, timeout)
+    return response["stages"]
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    import ocr_pool
+
+    try:
+        header, payload = await _read_message(reader, ocr_pool.MAX_ATTACHMENT_SIZE)
+        try:
+            if header.get("kind") == "metrics":
+                _write_message(writer, {"ok": True, "stages": metrics.summary()})
+                return await writer.drain()
+            if header.get("kind") not in ("war", "league"):
+                raise ValueError(f"Unknown kind {header.get('kind')!r}")
+            result = await ocr_pool.extract_local(header["kind"], payload)
+            if not isinstance(result, OCRResult):
+                result = OCRResult(result, {})
+            response = {"ok": True, "result": result.to_json()}
+        except Exception as e:
+            logging.error(f"Failed to extract {header.get('kind')} screenshot: {e}")
+            response = {"ok": False, "error": repr(e)}
+        _write_message(writer, response)
+        await writer.drain()
+    except asyncio.IncompleteReadError as e:
+        # available() connects and hangs up without sending anything
+        if e.partial:
+            logging.warning(f"Dropped OCR request: {e}")
+    except (ConnectionError, ValueError) as e:
+        logging.warning(f"Dropped OCR request: {e}")
+    finally:
+        writer.close()
+
+
+async def serve(path=OCR_SOCKET, workers=None):
+    import ocr_pool
+
+    if available(path):
+        raise SystemExit(f"An OCR service is already listening on {path}")
+    if os.path.exists(path):
+        # Left behind by a service that didn't shut down cleanly
+        os.remove(path)
+
+    ocr_pool.start_local(workers or ocr_pool.OCR_WORKERS)
+    server = await asyncio.start_unix_server(_handle, path)
+    logging.info(f"OCR service listening on {path}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        ocr_pool.stop_ocr()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve screenshot extraction to the bot from pre-warmed workers"
+    )
+    parser.add_argument("--socket", default=OCR_SOCKET)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.socket, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
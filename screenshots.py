@@ -1,13 +1,23 @@
+import fcntl
+import hashlib
 import io
+import json
 import logging
+import os
 import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 
 import cv2
 import numpy as np
-import pytesseract
 from PIL import Image
 
+from metrics import timer
+from ocr_backend import get_backend
+from ocr_result import OCR_RETRY_CONF, OCRResult
+
 WAR_COORDS = {
     "points_scored": (0.335, 0.21, 0.405, 0.26),
     "opponent_server": (0.67, 0.1, 0.766, 0.14),
@@ -47,6 +57,38 @@ LEAGUE_COORDS = {
         "rank2": (0.31, 0.51, 0.43, 0.6),
     },
 }
+NUMERIC_FIELDS = ("points_scored", "opponent_scored", "opponent_server")
+# Off until assets/benchmark.py --compare-batched shows the same fields as per-region
+WAR_BATCHED = os.getenv("OCR_BATCHED", "0") == "1"
+TILE_PADDING = 10
+PANEL_SCAN_WIDTH = 640
+OCR_TARGET_SIZE = int(os.getenv("OCR_TARGET_SIZE", 1080))
+MAX_IMAGE_PIXELS = int(os.getenv("OCR_MAX_PIXELS", 40_000_000))
+DIGITS_ENABLED = os.getenv("OCR_DIGITS", "1") == "1"
+DIGITS_DIR = os.getenv("OCR_DIGITS_DIR", "digits")
+DIGITS_MIN_CONF = float(os.getenv("OCR_DIGITS_MIN_CONF", 90))
+DIGITS_LEARN_CONF = 80
+DIGITS_LEARN_AGREE = int(os.getenv("OCR_DIGITS_LEARN_AGREE", 3))
+DIGITS = "0123456789"
+GLYPH_SIZE = (16, 24)
+GLYPH_TEMPLATES = 8
+GLYPH_CANDIDATES = 256
+ANCHORS_ENABLED = os.getenv("OCR_ANCHORS", "1") == "1"
+ANCHORS_DIR = os.getenv("OCR_ANCHORS_DIR", "anchors")
+ANCHOR_MIN_SCORE = float(os.getenv("OCR_ANCHOR_MIN_SCORE", 0.7))
+ANCHOR_SCAN_HEIGHT = 480
+ANCHOR_SCALES = (0.8, 0.9, 1.0, 1.1, 1.25)
+ANCHOR_LEARN_AGREE = int(os.getenv("OCR_ANCHOR_LEARN_AGREE", 3))
+ANCHOR_LEARN_CONF = 80
+PANEL_MIN_AREA = 0.2
+PANEL_RATIO_TOLERANCE = 0.02
+PANEL_BOX_TOLERANCE = 0.01
+PANEL_PENDING = 64
+SPECULATIVE = os.getenv("OCR_SPECULATIVE", "0") == "1"
+# The speculative reads run on threads, so the lazily built singletons below are
+# created under this lock
+_singleton_lock = threading.Lock()
+OCR_RETRY_SCALE = 2
 LEAGUES = {
     "Baron": {"Baron"},
     "Viscount": {"Viscount", "Vicomte", "Visconte"},
@@ -55,72 +97,313 @@ LEAGUES = {
 }
 
 
-def extract_war(img_bytes, debug=False):
-    panel, W, H = _adjust_screenshot(img_bytes)
-
-    result = {}
-    for key, (x1, y1, x2, y2) in WAR_COORDS.items():
-        crop = panel.crop((x1 * W, y1 * H, x2 * W, y2 * H))
-        if debug:
-            crop.show()
-        label: str = pytesseract.image_to_string(crop, config="--psm 7").strip()
-        if key in (
-            "points_scored",
-            "opponent_scored",
-            "opponent_server",
-        ):
-            number = re.search(r"\d+", label)
-            data = int(number.group()) if number and number.group().isdigit() else None
-        elif key == "date":
-            try:
-                day, month, year = label.removesuffix(" J").split("/")
-                data = date(int(year), int(month), int(day))
-            except Exception as e:
-                logging.error(f"FAILED DATE: {label}", e)
-                data = None
-        else:
-            data = label
-        result[key] = data
+def extract_war(img_bytes, debug=False, batched=None):
+    with timer("extract.war"):
+        return _extract_war(img_bytes, debug, batched)
 
-    return result
 
+def _extract_war(img_bytes, debug, batched):
+    image = _load_image(img_bytes)
+    with timer("panel"):
+        panel, W, H = _adjust_screenshot(image)
+    with timer("crop"):
+        crops = {
+            key: _crop(panel, (x1 * W, y1 * H, x2 * W, y2 * H))
+            for key, (x1, y1, x2, y2) in WAR_COORDS.items()
+        }
+    if debug:
+        for crop in crops.values():
+            Image.fromarray(crop).show()
+
+    labels = {}
+    confidences = {}
+    if DIGITS_ENABLED:
+        for key in NUMERIC_FIELDS:
+            with timer("digits"):
+                text, conf = get_digit_recognizer().recognize(crops[key])
+            if conf >= DIGITS_MIN_CONF:
+                labels[key] = text
+                confidences[key] = conf
+    remaining = {key: crop for key, crop in crops.items() if key not in labels}
+
+    if batched is None:
+        batched = WAR_BATCHED
+    if batched:
+        with timer("ocr.tiled"):
+            ocr_labels, ocr_confidences = _ocr_tiled(remaining)
+        labels.update(ocr_labels)
+        confidences.update(ocr_confidences)
+    else:
+        for key, crop in remaining.items():
+            with timer(f"ocr.{key}"):
+                labels[key], confidences[key] = _read(crop, "--psm 7")
+    if DIGITS_ENABLED:
+        for key in NUMERIC_FIELDS:
+            if key in remaining and confidences[key] >= DIGITS_LEARN_CONF:
+                get_digit_recognizer().learn(remaining[key], labels[key])
+
+    for key, crop in remaining.items():
+        if confidences[key] < OCR_RETRY_CONF:
+            with timer(f"retry.{key}"):
+                labels[key], confidences[key] = _reread(
+                    crop, "--psm 7", labels[key], confidences[key]
+                )
+
+    return OCRResult(
+        {key: _parse_war_field(key, labels[key]) for key in WAR_COORDS},
+        {key: confidences[key] for key in WAR_COORDS},
+    )
+
+
+def _parse_war_field(key, label):
+    if key in NUMERIC_FIELDS:
+        number = re.search(r"\d+", label)
+        return int(number.group()) if number and number.group().isdigit() else None
+    if key == "date":
+        try:
+            day, month, year = label.removesuffix(" J").split("/")
+            return date(int(year), int(month), int(day))
+        except Exception as e:
+            logging.error(f"FAILED DATE: {label}", e)
+            return None
+    return label
+
+
+def _ocr_tiled(
+    crops: dict[str, np.ndarray],
+) -> tuple[dict[str, str], dict[str, float]]:
+    # Stack every crop on one canvas so tesseract only starts once per screenshot,
+    # each tile gets its own band and words are mapped back by their vertical center.
+    # The sides repeat each crop's own edge and the gap between tiles is filled with
+    # the crop's background, the median of its border pixels. A white fill would shift
+    # tesseract's thresholding away from what the per-region reads see, and repeating
+    # the top and bottom rows across the gap would draw streaks through it.
+    gap = max(crop.shape[0] for crop in crops.values()) // 2 + TILE_PADDING
+    width = max(crop.shape[1] for crop in crops.values()) + 2 * TILE_PADDING
+    tiles = []
+    bands = {}
+    top = 0
+    for key, crop in crops.items():
+        h, w = crop.shape[:2]
+        border = np.concatenate([crop[0], crop[-1], crop[:, 0], crop[:, -1]])
+        background = np.median(border, axis=0).tolist()
+        tile = cv2.copyMakeBorder(
+            np.ascontiguousarray(crop),
+            0,
+            0,
+            TILE_PADDING,
+            width - w - TILE_PADDING,
+            cv2.BORDER_REPLICATE,
+        )
+        tiles.append(
+            cv2.copyMakeBorder(
+                tile,
+                gap // 2,
+                gap - gap // 2,
+                0,
+                0,
+                cv2.BORDER_CONSTANT,
+                value=background,
+            )
+        )
+        bands[key] = (top, top + h + gap)
+        top += h + gap
+    canvas = np.vstack(tiles)
+
+    data = get_backend().image_to_data(canvas, config="--psm 6")
+    words = {key: [] for key in crops}
+    for text, left, word_top, height, conf in zip(
+        data["text"], data["left"], data["top"], data["height"], data["conf"]
+    ):
+        if not text.strip():
+            continue
+        center = word_top + height / 2
+        for key, (band_top, band_bottom) in bands.items():
+            if band_top <= center < band_bottom:
+                words[key].append((left, text, conf))
+                break
+
+    labels = {
+        key: " ".join(text for _, text, _ in sorted(key_words))
+        for key, key_words in words.items()
+    }
+    confidences = {
+        key: min((conf for _, _, conf in key_words), default=-1)
+        for key, key_words in words.items()
+    }
+    return labels, confidences
+
+
+def _read(image: np.ndarray, config: str) -> tuple[str, float]:
+    data = get_backend().image_to_data(image, config=config)
+    words = [
+        (text, conf) for text, conf in zip(data["text"], data["conf"]) if text.strip()
+    ]
+    if not words:
+        return "", -1.0
+    return " ".join(text for text, _ in words), min(conf for _, conf in words)
+
+
+def _reread(crop: np.ndarray, config: str, text: str, conf: float):
+    # Only low confidence fields pay for the heavier preprocessing, the second read
+    # is kept when tesseract is more sure of it than of the first one
+    gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY) if crop.ndim == 3 else crop
+    gray = cv2.resize(
+        gray,
+        None,
+        fx=OCR_RETRY_SCALE,
+        fy=OCR_RETRY_SCALE,
+        interpolation=cv2.INTER_CUBIC,
+    )
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if binary.mean() < 127:
+        binary = cv2.bitwise_not(binary)
+    binary = cv2.copyMakeBorder(
+        binary,
+        TILE_PADDING,
+        TILE_PADDING,
+        TILE_PADDING,
+        TILE_PADDING,
+        cv2.BORDER_CONSTANT,
+        value=255,
+    )
+    retry_text, retry_conf = _read(binary, config)
+    if retry_conf > conf:
+        return retry_text, retry_conf
+    return text, conf
+
+
+def _load_image(img_bytes) -> np.ndarray:
+    # Only the header is parsed to get the dimensions, the pixels are then decoded
+    # straight at the smallest scale that still leaves OCR_TARGET_SIZE on the short side
+    # A header that can't be read is rejected too, the pixel count can't be checked
+    try:
+        with Image.open(io.BytesIO(img_bytes)) as header:
+            W, H = header.size
+    except Image.DecompressionBombError as e:
+        raise ValueError(f"Screenshot is too large: {e}") from e
+    except Exception as e:
+        raise ValueError("Could not decode screenshot") from e
+    if W * H > MAX_IMAGE_PIXELS:
+        raise ValueError(f"Screenshot is too large ({W}x{H})")
+
+    flag = cv2.IMREAD_COLOR
+    for factor, reduced_flag in (
+        (8, cv2.IMREAD_REDUCED_COLOR_8),
+        (4, cv2.IMREAD_REDUCED_COLOR_4),
+        (2, cv2.IMREAD_REDUCED_COLOR_2),
+    ):
+        if min(W, H) / factor >= OCR_TARGET_SIZE:
+            flag = reduced_flag
+            break
 
-def _adjust_screenshot(img_bytes):
     img_array = np.frombuffer(img_bytes, np.uint8)
-    image = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+    with timer("decode"):
+        image = cv2.imdecode(img_array, flag)
+    if image is None:
+        raise ValueError("Could not decode screenshot")
+    return image
+
+
+def _crop(image: np.ndarray, box) -> np.ndarray:
+    # Same rounding as PIL's Image.crop, returns an RGB view of the BGR image and only
+    # copies when the box runs past the edge, which PIL fills with black
+    left, top, right, bottom = (round(v) for v in box)
+    H, W = image.shape[:2]
+    # Clamped to the image so a box entirely outside of it gives an empty slice
+    # instead of negative indices counting from the end
+    y0, x0 = min(max(top, 0), H), min(max(left, 0), W)
+    y1, x1 = max(min(bottom, H), y0), max(min(right, W), x0)
+    crop = image[y0:y1, x0:x1, ::-1]
+    if not crop.size:
+        return np.zeros((max(bottom - top, 0), max(right - left, 0), 3), np.uint8)
+    if left < 0 or top < 0 or right > W or bottom > H:
+        pad_top = max(min(y0, bottom) - top, 0)
+        pad_bottom = max(bottom - max(y1, top), 0)
+        pad_left = max(min(x0, right) - left, 0)
+        pad_right = max(right - max(x1, left), 0)
+        crop = cv2.copyMakeBorder(
+            np.ascontiguousarray(crop),
+            pad_top,
+            pad_bottom,
+            pad_left,
+            pad_right,
+            cv2.BORDER_CONSTANT,
+            value=(0, 0, 0),
+        )
+    return crop
+
 
+def _panel_mask(image: np.ndarray) -> np.ndarray:
     hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    mask = cv2.inRange(hsv, (10, 50, 50), (30, 255, 255))
+    return cv2.inRange(hsv, (10, 50, 50), (30, 255, 255))
 
-    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    x, y, w, h = (
-        cv2.boundingRect(max(contours, key=cv2.contourArea))
-        if contours
-        else (0, 0, image.shape[1], image.shape[0])
-    )
 
-    panel = Image.fromarray(
-        cv2.cvtColor(image[y : y + h, x : x + w], cv2.COLOR_BGR2RGB)
+def _adjust_screenshot(image: np.ndarray):
+    # The panel is located on a reduced copy, then its edges are snapped back to full
+    # resolution on thin strips so the full image is never converted as a whole
+    scale = min(1.0, PANEL_SCAN_WIDTH / image.shape[1])
+    small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    contours, _ = cv2.findContours(
+        _panel_mask(small), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
     )
-    W, H = panel.size
+    if contours:
+        x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+        x, y, w, h = _refine_panel(
+            image, x / scale, y / scale, w / scale, h / scale, scale
+        )
+    else:
+        x, y, w, h = 0, 0, image.shape[1], image.shape[0]
+
+    panel = image[y : y + h, x : x + w]
+    H = panel.shape[0]
     W = H * 1.8260105448154658
     return panel, W, H
 
 
-def _get_coords(name, size):
-    W, H = size
+def _refine_panel(image, x, y, w, h, scale):
+    if scale == 1.0:
+        return int(x), int(y), int(w), int(h)
+    margin = int(np.ceil(4 / scale))
+    img_h, img_w = image.shape[:2]
+    x0, y0 = max(int(x) - margin, 0), max(int(y) - margin, 0)
+    x1, y1 = min(int(x + w) + margin, img_w), min(int(y + h) + margin, img_h)
+
+    # A strip row or column belongs to the panel when most of it is panel colored,
+    # stray pixels of the same hue outside the panel are ignored
+    top = _panel_mask(image[y0 : min(int(y) + margin, y1), x0:x1]).mean(axis=1) > 127
+    bottom = (
+        _panel_mask(image[max(int(y + h) - margin, y0) : y1, x0:x1]).mean(axis=1) > 127
+    )
+    left = _panel_mask(image[y0:y1, x0 : min(int(x) + margin, x1)]).mean(axis=0) > 127
+    right = (
+        _panel_mask(image[y0:y1, max(int(x + w) - margin, x0) : x1]).mean(axis=0) > 127
+    )
+
+    new_y = y0 + int(top.argmax()) if top.any() else int(y)
+    new_x = x0 + int(left.argmax()) if left.any() else int(x)
+    new_y1 = y1 - int(bottom[::-1].argmax()) if bottom.any() else int(y + h)
+    new_x1 = x1 - int(right[::-1].argmax()) if right.any() else int(x + w)
+    return new_x, new_y, new_x1 - new_x, new_y1 - new_y
+
+
+def get_category(W, H) -> str:
     rat = W / H
     if rat < 1.3:
-        category = "zflip"
-    elif rat < 1.5:
-        category = "skinny"
-    elif rat < 2:
-        category = "slim"
-    elif rat < 2.2:
-        category = "medium"
-    else:
-        category = "large"
-    x1, y1, x2, y2 = LEAGUE_COORDS[category][name]
+        return "zflip"
+    if rat < 1.5:
+        return "skinny"
+    if rat < 2:
+        return "slim"
+    if rat < 2.2:
+        return "medium"
+    return "large"
+
+
+def _get_coords(name, size):
+    W, H = size
+    x1, y1, x2, y2 = LEAGUE_COORDS[get_category(W, H)][name]
     left = x1 * W
     top = y1 * H
     right = x2 * W
@@ -128,36 +411,120 @@ def _get_coords(name, size):
     return left, top, right, bottom
 
 
-def get_label(image: Image.Image, name: str, debug: bool) -> str:
-    crop = image.crop(_get_coords(name, image.size))
-    if debug:
-        crop.show()
-    config = (
-        "--psm 7 -c tessedit_char_whitelist=0123456789/"
-        if name.startswith("total")
-        else "--psm 6"
-    )
-    return pytesseract.image_to_string(crop, config=config)
+def get_label(image: np.ndarray, name: str, debug: bool, box=None) -> tuple[str, float]:
+    with timer(f"ocr.{name}"):
+        return _get_label(image, name, debug, box)
 
 
-def extract_league(img_bytes, debug=False):
-    image = Image.open(io.BytesIO(img_bytes))
+def _get_label(image, name, debug, box):
+    if box is None:
+        box = _get_coords(name, (image.shape[1], image.shape[0]))
+    crop = _crop(image, box)
     if debug:
-        print(image.width / image.height)
+        Image.fromarray(crop).show()
+    if not name.startswith("total"):
+        config = "--psm 6"
+    else:
+        if DIGITS_ENABLED:
+            text, conf = get_digit_recognizer().recognize(crop)
+            if conf >= DIGITS_MIN_CONF:
+                return text, conf
+        config = "--psm 7 -c tessedit_char_whitelist=0123456789/"
 
+    text, conf = _read(crop, config)
+    if conf < OCR_RETRY_CONF:
+        text, conf = _reread(crop, config, text, conf)
+    if DIGITS_ENABLED and name.startswith("total") and conf >= DIGITS_LEARN_CONF:
+        get_digit_recognizer().learn(crop, text)
+    return text, conf
+
+
+def _resolve_league(label) -> tuple[str, str | None, str]:
+    # Returns which rank and total regions hold the data, not their text
     league = None
     total = None
-    rank = get_label(image, "rank", debug)
+    rank = "rank"
     for e_league, translations in LEAGUES.items():
-        if any(w in rank for w in translations):
+        if any(w in label(rank) for w in translations):
             league = e_league
     if league is None:
-        rank = get_label(image, "rank2", debug)
-        if "Duke" in rank or "Duc" in rank:
+        rank = "rank2"
+        if "Duke" in label(rank) or "Duc" in label(rank):
             league = "Duke"
-            total = get_label(image, "total2", debug)
+            total = "total2"
     if total is None:
-        total = get_label(image, "total", debug)
+        total = "total"
+    label(total)
+    return rank, league, total
+
+
+_speculative_pool: ThreadPoolExecutor = None
+
+
+def _get_speculative_pool() -> ThreadPoolExecutor:
+    global _speculative_pool
+    if _speculative_pool is None:
+        with _singleton_lock:
+            if _speculative_pool is None:
+                _speculative_pool = ThreadPoolExecutor(max_workers=4)
+    return _speculative_pool
+
+
+def extract_league(img_bytes, debug=False):
+    with timer("extract.league"):
+        return _extract_league(img_bytes, debug)
+
+
+def _extract_league(img_bytes, debug):
+    image = _load_image(img_bytes)
+    if debug:
+        print(image.shape[1] / image.shape[0])
+
+    boxes = None
+    if ANCHORS_ENABLED:
+        with timer("anchors"):
+            boxes = get_layout_locator().locate(image)
+    if boxes:
+        result, _ = _read_league(image, debug, boxes)
+        if result["league"] is not None and result["total_points"] is not None:
+            return result
+
+    # No anchor, or its boxes didn't read, the regions come from the aspect ratio
+    result, names = _read_league(image, debug, {})
+    if ANCHORS_ENABLED and (
+        result["league"] is not None
+        and result["total_points"] is not None
+        and min(result.confidence.values()) >= ANCHOR_LEARN_CONF
+    ):
+        size = (image.shape[1], image.shape[0])
+        get_layout_locator().learn(
+            image, {name: _get_coords(name, size) for name in names}
+        )
+    return result
+
+
+def _read_league(image, debug, boxes) -> tuple[OCRResult, tuple[str, ...]]:
+    # Regions missing from boxes fall back to the aspect-ratio coordinates
+    def read(name):
+        return get_label(image, name, debug, boxes.get(name))
+
+    if SPECULATIVE:
+        # OCR every candidate region at once and keep the combination the serial
+        # chain would have picked
+        names = ("rank", "rank2", "total", "total2")
+        labels = dict(zip(names, _get_speculative_pool().map(read, names)))
+        rank_name, league, total_name = _resolve_league(lambda name: labels[name][0])
+    else:
+        labels = {}
+
+        def label(name):
+            if name not in labels:
+                labels[name] = read(name)
+            return labels[name][0]
+
+        rank_name, league, total_name = _resolve_league(label)
+    rank, rank_conf = labels[rank_name]
+    total, total_conf = labels[total_name]
 
     matches = re.findall(r"\d+", rank)
     division = int(matches[-1]) if matches else None
@@ -167,7 +534,13 @@ def extract_league(img_bytes, debug=False):
         points = points.group().replace(" ", "")
         result["total_points"] = int(points[: _get_chars(league, division, points)])
 
-    return result
+    return (
+        OCRResult(
+            result,
+            {"league": rank_conf, "division": rank_conf, "total_points": total_conf},
+        ),
+        (rank_name, total_name),
+    )
 
 
 def _get_chars(league: str, division: int, points: str):
@@ -178,3 +551,409 @@ def _get_chars(league: str, division: int, points: str):
     ):
         return 3
     return 4
+
+
+class DigitRecognizer:
+    # The game draws numbers in one fixed font, so once a glyph has been seen it can be
+    # recognized by correlating against the stored bitmaps. Templates are learned from
+    # tesseract reads whose glyph count matches the text and kept in DIGITS_DIR. A glyph
+    # only becomes a template after DIGITS_LEARN_AGREE reads of it agree on its digit,
+    # and nothing is recognized until every digit has a template.
+    def __init__(self, directory=DIGITS_DIR):
+        self.directory = directory
+        self.templates: dict[str, list[np.ndarray]] = {}
+        # Glyphs seen but not trusted yet, with the characters tesseract read them as
+        self.candidates: list[tuple[np.ndarray, Counter[str]]] = []
+        # Speculative reads learn from several threads at once
+        self._learn_lock = threading.Lock()
+        if directory and os.path.isdir(directory):
+            for fp in sorted(os.listdir(directory)):
+                code, _, _ = fp.partition("_")
+                if not fp.endswith(".png") or not code.isdigit():
+                    continue
+                glyph = cv2.imread(os.path.join(directory, fp), cv2.IMREAD_GRAYSCALE)
+                if glyph is not None and glyph.shape[::-1] == GLYPH_SIZE:
+                    self.templates.setdefault(chr(int(code)), []).append(glyph)
+
+    def _segment(self, crop: np.ndarray) -> list[tuple[int, int, np.ndarray]]:
+        gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY) if crop.ndim == 3 else crop
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        if binary.mean() > 127:
+            binary = cv2.bitwise_not(binary)
+
+        count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        boxes = sorted(
+            (x, y, w, h)
+            for x, y, w, h, area in stats[1:count]
+            if h >= binary.shape[0] * 0.3 and area >= 4
+        )
+        # Broken strokes of one glyph overlap horizontally, merge them back together
+        merged = []
+        for x, y, w, h in boxes:
+            if merged and x < merged[-1][0] + merged[-1][2] * 0.8:
+                mx, my, mw, mh = merged[-1]
+                nx, ny = min(mx, x), min(my, y)
+                merged[-1] = (
+                    nx,
+                    ny,
+                    max(mx + mw, x + w) - nx,
+                    max(my + mh, y + h) - ny,
+                )
+            else:
+                merged.append((x, y, w, h))
+
+        return [
+            (
+                x,
+                w,
+                cv2.resize(
+                    binary[y : y + h, x : x + w],
+                    GLYPH_SIZE,
+                    interpolation=cv2.INTER_AREA,
+                ),
+            )
+            for x, y, w, h in merged
+        ]
+
+    def _match(self, glyph: np.ndarray) -> tuple[str | None, float, float]:
+        scores = {}
+        for char, templates in list(self.templates.items()):
+            scores[char] = max(
+                float(cv2.matchTemplate(glyph, t, cv2.TM_CCOEFF_NORMED)[0, 0])
+                for t in list(templates)
+            )
+        if not scores:
+            return None, 0.0, 0.0
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        best_char, best = ranked[0]
+        second = ranked[1][1] if len(ranked) > 1 else 0.0
+        return best_char, best, second
+
+    @property
+    def ready(self) -> bool:
+        return all(self.templates.get(digit) for digit in DIGITS)
+
+    def recognize(self, crop: np.ndarray) -> tuple[str, float]:
+        if not self.ready:
+            return "", 0.0
+        glyphs = self._segment(crop)
+        if not glyphs:
+            return "", 0.0
+
+        gaps = [x - (px + pw) for (px, pw, _), (x, _, _) in zip(glyphs, glyphs[1:])]
+        space = max(
+            np.median(gaps) * 2 if gaps else 0,
+            np.median([w for _, w, _ in glyphs]) * 0.4,
+        )
+        text = ""
+        conf = 100.0
+        previous_end = None
+        for x, w, glyph in glyphs:
+            char, best, second = self._match(glyph)
+            if char is None:
+                return "", 0.0
+            # A glyph that looks almost as much like another character isn't trusted
+            conf = min(conf, best * 100 if best - second >= 0.05 else 0.0)
+            if previous_end is not None and x - previous_end > space:
+                text += " "
+            text += char
+            previous_end = x + w
+        return text, conf
+
+    def learn(self, crop: np.ndarray, text: str):
+        chars = [c for c in text if not c.isspace()]
+        glyphs = self._segment(crop)
+        if not chars or len(chars) != len(glyphs):
+            return
+        with self._learn_lock:
+            for char, (_, _, glyph) in zip(chars, glyphs):
+                self._learn_glyph(char, glyph)
+
+    def _learn_glyph(self, char: str, glyph: np.ndarray):
+        known = self.templates.get(char, [])
+        if len(known) >= GLYPH_TEMPLATES:
+            return
+        best_char, best, _ = self._match(glyph)
+        if best >= 0.97 and best_char == char:
+            return
+        if best >= DIGITS_MIN_CONF / 100 and best_char != char:
+            # Tesseract disagrees with a confident template, don't learn either way
+            return
+        if not self._agreed(char, glyph):
+            return
+        known.append(glyph)
+        self.templates[char] = known
+        if self.directory:
+            self._save(char, glyph)
+
+    def _agreed(self, char: str, glyph: np.ndarray) -> bool:
+        # One confident misread must not become a template that then short-circuits
+        # every later read, the same glyph has to be read the same way several times
+        for n, (candidate, reads) in enumerate(self.candidates):
+            if (
+                float(cv2.matchTemplate(glyph, candidate, cv2.TM_CCOEFF_NORMED)[0, 0])
+                < 0.97
+            ):
+                continue
+            reads[char] += 1
+            if len(reads) == 1 and reads[char] >= DIGITS_LEARN_AGREE:
+                del self.candidates[n]
+                return True
+            return False
+        self.candidates.append((glyph, Counter({char: 1})))
+        del self.candidates[:-GLYPH_CANDIDATES]
+        return DIGITS_LEARN_AGREE <= 1
+
+    def _save(self, char, glyph):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            digest = hashlib.sha1(glyph.tobytes()).hexdigest()[:12]
+            cv2.imwrite(
+                os.path.join(self.directory, f"{ord(char)}_{digest}.png"), glyph
+            )
+        except OSError as e:
+            logging.error(f"Could not save digit template: {e}")
+
+
+_digit_recognizer: DigitRecognizer = None
+
+
+def get_digit_recognizer() -> DigitRecognizer:
+    global _digit_recognizer
+    if _digit_recognizer is None:
+        with _singleton_lock:
+            if _digit_recognizer is None:
+                _digit_recognizer = DigitRecognizer()
+    return _digit_recognizer
+
+
+def _find_panel(image: np.ndarray) -> tuple[float, float, float, float] | None:
+    # The league screen is drawn on a bordered panel, its outline is the largest convex
+    # quadrilateral in an edge map of a reduced copy
+    scale = ANCHOR_SCAN_HEIGHT / image.shape[0]
+    gray = cv2.cvtColor(
+        cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA),
+        cv2.COLOR_BGR2GRAY,
+    )
+    edges = cv2.dilate(cv2.Canny(gray, 50, 150), np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    area = gray.shape[0] * gray.shape[1]
+    best = None
+    for contour in contours:
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        if len(approx) != 4 or not cv2.isContourConvex(approx):
+            continue
+        x, y, w, h = cv2.boundingRect(approx)
+        if not PANEL_MIN_AREA * area <= w * h < 0.95 * area:
+            continue
+        if best is None or w * h > best[2] * best[3]:
+            best = (x, y, w, h)
+    if best is None:
+        return None
+    return tuple(value / scale for value in best)
+
+
+class LayoutLocator:
+    # Finds the league fields from the screen itself instead of the aspect ratio, so
+    # each field is read once on any device. Two kinds of anchors live in
+    # ANCHORS_DIR/layouts.json:
+    # {"<layout>": {"template": "emblem.png", "reference_height": 1080,
+    #               "fields": {"rank": [x1, y1, x2, y2], "total": [x1, y1, x2, y2]}}}
+    # where reference_height is the height of the screenshot the anchor was cut from and
+    # field boxes are in anchor widths/heights from the anchor's top-left corner, and
+    # {"panel-<ratio>": {"anchor": "panel", "ratio": 1.6, "fields": {...}}}
+    # with boxes in fractions of the panel found by _find_panel. Panel layouts are
+    # learned: when the aspect-ratio regions give a confident read, the regions used are
+    # stored relative to the panel once ANCHOR_LEARN_AGREE screenshots agree on them.
+    # Every OCR worker process learns, so the boxes waiting for agreement are kept in
+    # ANCHORS_DIR/pending.json and both files are merged under a file lock, and each
+    # worker reloads layouts.json when another one has changed it.
+    def __init__(self, directory=ANCHORS_DIR):
+        self.directory = directory
+        self.layouts = []
+        self.panels: dict[str, dict] = {}
+        # Panel layout -> field -> boxes seen but not agreed on yet, only used when
+        # there is no directory to share them through
+        self.pending: dict[str, dict[str, list]] = {}
+        self.mtime = None
+        self._load()
+
+    def _load(self):
+        if not self.directory:
+            return
+        layouts_fp = os.path.join(self.directory, "layouts.json")
+        try:
+            mtime = os.stat(layouts_fp).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self.mtime:
+            return
+        layouts = _read_json(layouts_fp)
+        self.mtime = mtime
+        self.layouts, self.panels = [], {}
+        for name, layout in layouts.items():
+            if layout.get("anchor") == "panel":
+                self.panels[name] = layout
+                continue
+            template = cv2.imread(
+                os.path.join(self.directory, layout["template"]), cv2.IMREAD_GRAYSCALE
+            )
+            if template is None:
+                logging.error(f"Missing anchor template for layout {name}")
+                continue
+            base = ANCHOR_SCAN_HEIGHT / layout["reference_height"]
+            scaled = [
+                cv2.resize(
+                    template,
+                    None,
+                    fx=base * factor,
+                    fy=base * factor,
+                    interpolation=cv2.INTER_AREA,
+                )
+                for factor in ANCHOR_SCALES
+            ]
+            self.layouts.append((name, scaled, layout["fields"]))
+
+    def locate(self, image: np.ndarray) -> dict[str, tuple] | None:
+        try:
+            self._load()
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not reload layouts: {e}")
+        boxes = self._locate_template(image) if self.layouts else None
+        if boxes is None and self.panels:
+            boxes = self._locate_panel(image)
+        return boxes
+
+    def _locate_template(self, image):
+        scale = ANCHOR_SCAN_HEIGHT / image.shape[0]
+        gray = cv2.cvtColor(
+            cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA),
+            cv2.COLOR_BGR2GRAY,
+        )
+
+        best = None
+        for _, templates, fields in self.layouts:
+            for template in templates:
+                h, w = template.shape
+                if h > gray.shape[0] or w > gray.shape[1] or min(h, w) < 8:
+                    continue
+                _, score, _, (x, y) = cv2.minMaxLoc(
+                    cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
+                )
+                if best is None or score > best[0]:
+                    best = (score, fields, x, y, w, h)
+        if best is None or best[0] < ANCHOR_MIN_SCORE:
+            return None
+
+        _, fields, x, y, w, h = best
+        x, y, w, h = x / scale, y / scale, w / scale, h / scale
+        return {
+            name: (x + x1 * w, y + y1 * h, x + x2 * w, y + y2 * h)
+            for name, (x1, y1, x2, y2) in fields.items()
+        }
+
+    def _locate_panel(self, image):
+        panel = _find_panel(image)
+        if panel is None:
+            return None
+        x, y, w, h = panel
+        layout = min(
+            self.panels.values(), key=lambda layout: abs(layout["ratio"] - w / h)
+        )
+        if abs(layout["ratio"] - w / h) > PANEL_RATIO_TOLERANCE:
+            return None
+        return {
+            name: (x + x1 * w, y + y1 * h, x + x2 * w, y + y2 * h)
+            for name, (x1, y1, x2, y2) in layout["fields"].items()
+        }
+
+    def learn(self, image: np.ndarray, boxes: dict[str, tuple]):
+        panel = _find_panel(image)
+        if panel is None:
+            return
+        x, y, w, h = panel
+        ratio = round(w / h, 2)
+        seen = {
+            field: ((left - x) / w, (top - y) / h, (right - x) / w, (bottom - y) / h)
+            for field, (left, top, right, bottom) in boxes.items()
+        }
+        if not self.directory:
+            self._agree(ratio, seen, self.panels, self.pending)
+            return
+
+        layouts_fp = os.path.join(self.directory, "layouts.json")
+        pending_fp = os.path.join(self.directory, "pending.json")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, "layouts.lock"), "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                # Read again under the lock so fields other workers learned since
+                # this one loaded are kept
+                layouts = _read_json(layouts_fp)
+                pending = _read_json(pending_fp)
+                learned, waiting = self._agree(ratio, seen, layouts, pending)
+                if learned:
+                    _write_json(layouts_fp, layouts)
+                if waiting:
+                    _write_json(pending_fp, pending)
+            self._load()
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not save learned layouts: {e}")
+
+    def _agree(self, ratio, seen, layouts, pending) -> tuple[bool, bool]:
+        name = f"panel-{ratio:.2f}"
+        layout = layouts.get(name, {"anchor": "panel", "ratio": ratio, "fields": {}})
+        waiting = pending.setdefault(name, {})
+        learned = touched = False
+        for field, box in seen.items():
+            if field in layout["fields"]:
+                continue
+            touched = True
+            # The panel outline is found on a reduced copy, a field is only placed once
+            # several screenshots put it at the same spot
+            boxes = waiting.setdefault(field, [])
+            agreeing = [
+                other
+                for other in boxes
+                if max(abs(a - b) for a, b in zip(box, other)) <= PANEL_BOX_TOLERANCE
+            ]
+            if len(agreeing) + 1 < ANCHOR_LEARN_AGREE:
+                boxes.append(list(box))
+                del boxes[:-PANEL_PENDING]
+                continue
+            layout["fields"][field] = [
+                round(float(np.mean(values)), 4) for values in zip(box, *agreeing)
+            ]
+            del waiting[field]
+            learned = True
+        if not waiting:
+            del pending[name]
+        if learned:
+            layouts[name] = layout
+        return learned, touched
+
+
+def _read_json(fp) -> dict:
+    if not os.path.exists(fp):
+        return {}
+    with open(fp, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _write_json(fp, data):
+    tmp = f"{fp}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=2)
+    os.replace(tmp, fp)
+
+
+_layout_locator: LayoutLocator = None
+
+
+def get_layout_locator() -> LayoutLocator:
+    global _layout_locator
+    if _layout_locator is None:
+        with _singleton_lock:
+            if _layout_locator is None:
+                _layout_locator = LayoutLocator()
+    return _layout_locator
@@ -0,0 +1,137 @@
+import bisect
+import heapq
+import unicodedata
+from collections import defaultdict
+
+NGRAM_SIZE = 3
+SEARCH_LIMIT = 25
+
+
+def normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", str(text).casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).strip()
+
+
+class NgramIndex:
+    # Every 1..NGRAM_SIZE character substring of the normalized names points to the
+    # keys that contain it, a query intersects the postings of its own grams and only
+    # the survivors are checked with a real substring test, like LIKE '%query%'
+    def __init__(self, n=NGRAM_SIZE):
+        self.n = n
+        self.entries: dict[object, tuple[str, object]] = {}
+        self.postings: dict[str, set] = defaultdict(set)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def _grams(self, text: str, size=None) -> set[str]:
+        sizes = range(1, self.n + 1) if size is None else (size,)
+        return {
+            text[start : start + size]
+            for size in sizes
+            for start in range(len(text) - size + 1)
+        }
+
+    def add(self, key, text: str, value):
+        if key in self.entries:
+            self.remove(key)
+        normalized = normalize(text)
+        self.entries[key] = (normalized, value)
+        for gram in self._grams(normalized):
+            self.postings[gram].add(key)
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for gram in self._grams(entry[0]):
+            keys = self.postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.postings[gram]
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        return entry[1] if entry is not None else None
+
+    def clear(self):
+        self.entries.clear()
+        self.postings.clear()
+
+    def search(self, query: str, limit=SEARCH_LIMIT) -> list:
+        query = normalize(query)
+        if not query:
+            candidates = self.entries.keys()
+        else:
+            postings = sorted(
+                (
+                    self.postings.get(gram, set())
+                    for gram in self._grams(query, min(self.n, len(query)))
+                ),
+                key=len,
+            )
+            candidates = set.intersection(*postings) if postings else set()
+
+        ranked = []
+        for key in candidates:
+            text, value = self.entries[key]
+            position = text.find(query)
+            if position < 0:
+                continue
+            # Exact names first, then prefixes, then matches at a word start
+            if text == query:
+                tier = 0
+            elif position == 0:
+                tier = 1
+            elif not text[position - 1].isalnum():
+                tier = 2
+            else:
+                tier = 3
+            ranked.append((tier, position, len(text), text, value))
+        best = heapq.nsmallest(limit, ranked, key=lambda item: item[:4])
+        return [value for *_, value in best]
+
+
+class DateIndex:
+    # Distinct ISO dates kept sorted, with the number of rows on each so a date only
+    # disappears once nothing refers to it anymore
+    def __init__(self):
+        self.dates: list[str] = []
+        self.counts: dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.dates)
+
+    def clear(self):
+        self.dates.clear()
+        self.counts.clear()
+
+    def add(self, day: str, count=1):
+        if day not in self.counts:
+            bisect.insort(self.dates, day)
+            self.counts[day] = 0
+        self.counts[day] += count
+
+    def remove(self, day: str, count=1):
+        if day not in self.counts:
+            return
+        self.counts[day] -= count
+        if self.counts[day] <= 0:
+            del self.counts[day]
+            del self.dates[bisect.bisect_left(self.dates, day)]
+
+    def search(self, query: str, limit=SEARCH_LIMIT) -> list[str]:
+        query = query.strip()
+        if not query:
+            return self.dates[: -limit - 1 : -1]
+        # Dates typed from the start are one contiguous run of the sorted list, the
+        # remaining LIKE '%query%' matches can only start further in
+        start = bisect.bisect_left(self.dates, query)
+        end = bisect.bisect_left(self.dates, query + "\x7f", start)
+        matches = set(self.dates[start:end])
+        matches.update(day for day in self.dates if query in day[1:])
+        return sorted(matches, reverse=True)[:limit]
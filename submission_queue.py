@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import os
+from collections import Counter
+
+from dotenv import load_dotenv
+
+from ocr_pool import OCR_WORKERS
+
+load_dotenv()
+
+QUEUE_CONCURRENCY = int(os.getenv("QUEUE_CONCURRENCY", max(1, OCR_WORKERS // 2)))
+QUEUE_PER_USER = int(os.getenv("QUEUE_PER_USER", 2))
+QUEUE_MAX_DEPTH = int(os.getenv("QUEUE_MAX_DEPTH", 30))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class UserLimitReached(Exception):
+    pass
+
+
+class SubmissionQueue:
+    def __init__(
+        self,
+        concurrency=QUEUE_CONCURRENCY,
+        per_user=QUEUE_PER_USER,
+        max_depth=QUEUE_MAX_DEPTH,
+    ):
+        self.concurrency = concurrency
+        self.per_user = per_user
+        self.max_depth = max_depth
+        self.running = 0
+        self.waiting: list[tuple[asyncio.Future, object]] = []
+        self.in_flight: Counter[int] = Counter()
+        # Position updates still in flight, per waiting job
+        self._tasks: dict[tuple, set[asyncio.Task]] = {}
+
+    @property
+    def depth(self):
+        return len(self.waiting)
+
+    async def run(self, user_id, func, on_position=None):
+        if self.in_flight[user_id] >= self.per_user:
+            raise UserLimitReached
+        if self.running >= self.concurrency and len(self.waiting) >= self.max_depth:
+            raise QueueFull
+
+        self.in_flight[user_id] += 1
+        try:
+            await self._acquire(on_position)
+            try:
+                return await func()
+            finally:
+                self._release()
+        finally:
+            self.in_flight[user_id] -= 1
+            if not self.in_flight[user_id]:
+                del self.in_flight[user_id]
+
+    async def _acquire(self, on_position):
+        if self.running < self.concurrency and not self.waiting:
+            self.running += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        job = (future, on_position)
+        self.waiting.append(job)
+        self._notify(job, len(self.waiting))
+        try:
+            await future
+            # A late position update must not land after the job has started
+            await self._settle(job)
+        except asyncio.CancelledError:
+            if job in self.waiting:
+                self.waiting.remove(job)
+                self._notify_all()
+            elif future.done() and not future.cancelled():
+                # The slot was handed over right before the cancellation, pass it on
+                self._release()
+            raise
+
+    def _release(self):
+        if self.waiting:
+            # The slot goes straight to the next job, running stays the same
+            future, _ = self.waiting.pop(0)
+            future.set_result(None)
+            self._notify_all()
+        else:
+            self.running -= 1
+
+    def _notify_all(self):
+        for position, job in enumerate(self.waiting, start=1):
+            self._notify(job, position)
+
+    def _notify(self, job, position):
+        _, on_position = job
+        if on_position is None:
+            return
+        task = asyncio.create_task(on_position(position))
+        self._tasks.setdefault(job, set()).add(task)
+        task.add_done_callback(lambda task: self._done(job, task))
+
+    async def _settle(self, job):
+        tasks = self._tasks.pop(job, ())
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _done(self, job, task: asyncio.Task):
+        tasks = self._tasks.get(job)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                del self._tasks[job]
+        if not task.cancelled() and task.exception():
+            logging.warning(f"Failed to update queue position: {task.exception()}")